@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Benchmark convert_training_data.py on synthetic corpora of increasing size.
+
+Generates fake gerbil-mcp, Gerbil and Gambit checkouts (cookbook recipes,
+security rules, error fixes, resource and reference markdown with API
+headings, guide and tutorial docs, std .ss sources and -test.ss files,
+Gambit examples) laid out like the real ones, runs the converter end to end
+on each, and reports throughput and peak memory per scale point. Scale 1 is
+roughly today's corpus; everything runs offline.
+
+Usage:
+  python3 bench_convert.py                       # scales 1, 10
+  python3 bench_convert.py --scales 1,10,100 --jobs 0
+  python3 bench_convert.py --output bench.json   # save results
+  python3 bench_convert.py --baseline bench.json # fail on a >10% throughput drop
+  python3 bench_convert.py -- --zstd --shard-size 4MB   # extra converter flags
+
+Each point is converted cold, starting from an empty build cache; add --warm
+to also time a second run that the cache serves.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import convert_training_data as ctd
+
+CONVERTER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "convert_training_data.py")
+
+# Inputs at scale 1, close to the real checkouts
+BASE_COUNTS = {
+    "recipes": 683,
+    "security_rules": 35,
+    "error_fixes": 120,
+    "resource_docs": 12,
+    "reference_docs": 150,
+    "guide_docs": 4,
+    "tutorial_docs": 6,
+    "tutorial_sources": 25,
+    "std_sources": 200,
+    "test_files": 200,
+    "gambit_examples": 2,   # per example directory
+}
+
+
+# ═══════════════════════════════════════════════════════════════════════
+# Synthetic inputs
+# ═══════════════════════════════════════════════════════════════════════
+
+class Corpus:
+    """Seeded generator of prose, identifiers and Scheme code."""
+
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        syllables = ["ka", "lo", "mi", "ter", "vo", "sha", "rin", "du", "pel", "gor", "xi", "bra",
+                     "nu", "fe", "zan", "tol", "qui", "mer", "sto", "val"]
+        # Large enough vocabulary that unrelated texts aren't near-duplicates
+        self.words = sorted({"".join(self.rng.choices(syllables, k=self.rng.randint(1, 3)))
+                             for _ in range(6000)})
+        self.modules = [":std/sugar", ":std/iter", ":std/text/json", ":std/misc/hash",
+                        ":std/misc/list", ":std/actor", ":std/error", ":std/format"]
+
+    def prose(self, n_words: int) -> str:
+        words = self.rng.choices(self.words, k=n_words)
+        return " ".join(words).capitalize() + "."
+
+    def paragraphs(self, n: int, n_words: int = 60) -> str:
+        return "\n\n".join(self.prose(n_words) for _ in range(n))
+
+    def ident(self) -> str:
+        return "-".join(self.rng.choices(self.words, k=self.rng.randint(1, 3)))
+
+    def form(self) -> str:
+        """One top-level form: a define with strings, comments and nesting."""
+        name, a, b = self.ident(), self.ident(), self.ident()
+        head = self.rng.choice(["define", "def", "define"])
+        return (f";; {self.prose(8)}\n"
+                f"({head} ({name} {a} {b})\n"
+                f"  (let ((tbl (make-hash-table)))\n"
+                f"    (hash-put! tbl \"{self.ident()}\" {a})\n"
+                f"    (for ((x (in-range {self.rng.randint(1, 99)})))\n"
+                f"      (displayln \"{self.prose(4)}\" x))\n"
+                f"    (if (> {a} {b}) (list {a} {b}) (vector {b} #\\a))))")
+
+    def code(self, n_forms: int) -> str:
+        imports = " ".join(self.rng.sample(self.modules, 2))
+        return f"(import {imports})\n\n" + "\n\n".join(self.form() for _ in range(n_forms))
+
+    def markdown(self, title: str, n_sections: int, api: bool = False) -> str:
+        parts = [f"# {title}\n\n{self.paragraphs(2)}"]
+        for _ in range(n_sections):
+            heading = f"`{self.ident()}`" if api else self.prose(3).rstrip(".")
+            parts.append(f"### {heading}\n\n{self.paragraphs(1, 40)}\n\n"
+                         f"```scheme\n{self.code(1)}\n```\n\n{self.paragraphs(1, 30)}")
+        return "\n\n".join(parts) + "\n"
+
+
+def write(path: str, text: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def generate_tree(root: str, scale: int, seed: int) -> dict:
+    """Lay out gerbil-mcp/, gerbil/ and gambit/ under root. Returns input stats."""
+    c = Corpus(seed)
+    n = {key: max(1, count * scale) for key, count in BASE_COUNTS.items()}
+    mcp, gerbil, gambit = (os.path.join(root, d) for d in ("gerbil-mcp", "gerbil", "gambit"))
+
+    recipes = []
+    for i in range(n["recipes"]):
+        gotcha = i % 10 == 0
+        code = c.code(c.rng.randint(1, 3))
+        if gotcha:
+            code = f";; WRONG: {c.prose(5)}\n{c.form()}\n;; RIGHT\n{code}"
+        recipes.append({
+            "id": f"recipe-{i}", "title": c.prose(6).rstrip("."),
+            "tags": ["gotcha"] if gotcha else c.rng.sample(c.words, 3),
+            "imports": c.rng.sample(c.modules, c.rng.randint(0, 2)),
+            "code": code, "notes": c.prose(25) if i % 3 else "",
+        })
+    write(os.path.join(mcp, "cookbooks.json"), json.dumps(recipes, indent=2))
+    write(os.path.join(mcp, "security-rules.json"), json.dumps([
+        {"id": f"rule-{i}", "title": c.prose(5).rstrip("."), "severity": c.rng.choice(["high", "medium"]),
+         "scope": "ffi", "message": c.prose(30), "remediation": c.prose(20), "tags": c.rng.sample(c.words, 3)}
+        for i in range(n["security_rules"])], indent=2))
+    write(os.path.join(mcp, "error-fixes.json"), json.dumps([
+        {"id": f"fix-{i}", "pattern": c.prose(5), "fix": c.prose(25), "type": "Error",
+         "code_example": c.code(1), "wrong_example": c.form()}
+        for i in range(n["error_fixes"])], indent=2))
+    for i in range(n["resource_docs"]):
+        write(os.path.join(mcp, "src", "resources", f"resource-{i}.md"), c.markdown(f"Resource {i}", 8))
+
+    for i in range(n["reference_docs"]):
+        sub = ["std", "std/misc", "std/text", "gerbil"][i % 4]
+        write(os.path.join(gerbil, "doc", "reference", sub, f"{c.ident()}-{i}.md"),
+              c.markdown(f"Reference {i}", 8, api=True))
+    for i in range(n["guide_docs"]):
+        write(os.path.join(gerbil, "doc", "guide", f"guide-{i}.md"), c.markdown(f"Guide {i}", 12))
+    for i in range(n["tutorial_docs"]):
+        write(os.path.join(gerbil, "doc", "tutorials", f"tutorial-{i}.md"), c.markdown(f"Tutorial {i}", 10))
+    tutorials = ["httpd", "kvstore", "proxy", "lang", "ensemble"]
+    for i in range(n["tutorial_sources"]):
+        write(os.path.join(gerbil, "src", "tutorial", tutorials[i % 5], f"part-{i}.ss"), c.code(6))
+
+    std = os.path.join(gerbil, "src", "std")
+    for mod_path in ctd.STD_KEY_MODULES:
+        write(os.path.join(gerbil, mod_path), c.code(40 * scale))
+    for i in range(n["std_sources"]):
+        write(os.path.join(std, "gen", f"module-{i}.ss"), c.code(8))
+    for i in range(n["test_files"]):
+        write(os.path.join(std, "gen", f"module-{i}-test.ss"), c.code(5))
+
+    for dirname in ctd.GAMBIT_EXAMPLES:
+        for i in range(n["gambit_examples"]):
+            write(os.path.join(gambit, "examples", dirname, f"example-{i}.scm"), c.code(4))
+
+    files = size = 0
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return {"files": files, "bytes": size}
+
+
+# ═══════════════════════════════════════════════════════════════════════
+# Running the converter
+# ═══════════════════════════════════════════════════════════════════════
+
+def run_converter(root: str, out_dir: str, jobs: int, extra: list[str]) -> dict:
+    """Convert the tree under root once. Returns the converter's metrics report plus outer timing."""
+    metrics_path = os.path.join(out_dir, "convert_metrics.json")
+    cmd = [sys.executable, CONVERTER,
+           "--mcp-dir", os.path.join(root, "gerbil-mcp"),
+           "--gerbil-dir", os.path.join(root, "gerbil"),
+           "--gambit-dir", os.path.join(root, "gambit"),
+           "--output-dir", out_dir, "--metrics", metrics_path, "--jobs", str(jobs)]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd + extra, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        print(proc.stdout[-2000:])
+        print(f"ERROR: converter exited with status {proc.returncode}")
+        sys.exit(1)
+    with open(metrics_path) as f:
+        metrics = json.load(f)
+    metrics["process_wall_s"] = round(elapsed, 4)
+    return metrics
+
+
+def summarize(scale: int, inputs: dict, metrics: dict) -> dict:
+    total = metrics["total"]
+    return {
+        "scale": scale,
+        "input_files": inputs["files"],
+        "input_bytes": inputs["bytes"],
+        "entries": total["entries"],
+        "wall_s": metrics["process_wall_s"],
+        "cpu_s": total["cpu_s"],
+        "entries_per_s": round(total["entries"] / metrics["process_wall_s"], 1),
+        "input_mb_per_s": round(inputs["bytes"] / 2**20 / metrics["process_wall_s"], 2),
+        "peak_rss_mb": round(total["peak_rss_kb"] / 1024, 1),
+        "worker_peak_rss_mb": round(total["worker_peak_rss_kb"] / 1024, 1),
+        "bytes_written": total["bytes_written"],
+        "stages_s": {name: stage["wall_s"] for name, stage in metrics["stages"].items()},
+    }
+
+
+def print_table(results: list[dict]):
+    print(f"\n{'run':<10}{'files':>8}{'input':>10}{'entries':>10}{'wall':>9}{'entries/s':>11}"
+          f"{'MB/s':>7}{'RSS':>8}{'workers':>9}")
+    for r in results:
+        print(f"{r['run']:<10}{r['input_files']:>8,}{r['input_bytes'] / 2**20:>8.1f}MB{r['entries']:>10,}"
+              f"{r['wall_s']:>8.2f}s{r['entries_per_s']:>11,.0f}{r['input_mb_per_s']:>7.1f}"
+              f"{r['peak_rss_mb']:>6.0f}MB{r['worker_peak_rss_mb']:>7.0f}MB")
+    slowest = max(results, key=lambda r: r["wall_s"])
+    stages = sorted(slowest["stages_s"].items(), key=lambda x: -x[1])[:4]
+    print(f"\nSlowest stages at {slowest['run']}: " + ", ".join(f"{name} {t:.2f}s" for name, t in stages))
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float, jobs: int, extra: list[str]) -> bool:
+    """Check throughput against a saved run. Returns False on a regression."""
+    with open(baseline_path) as f:
+        saved = json.load(f)
+    baseline = {r["run"]: r for r in saved["results"]}
+    ok = True
+    print(f"\n── Against {baseline_path} ──")
+    if (saved["jobs"], saved["extra"]) != (jobs, extra):
+        print(f"  Note: baseline ran with --jobs {saved['jobs']} {' '.join(saved['extra'])}".rstrip())
+    for r in results:
+        base = baseline.get(r["run"])
+        if base is None:
+            continue
+        ratio = r["entries_per_s"] / base["entries_per_s"]
+        rss = r["peak_rss_mb"] / base["peak_rss_mb"] if base["peak_rss_mb"] else 1.0
+        regressed = ratio < 1 - tolerance
+        ok &= not regressed
+        print(f"  {r['run']:<10} throughput {ratio:6.2f}x   peak RSS {rss:5.2f}x"
+              f"{'   REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark convert_training_data.py on synthetic corpora")
+    parser.add_argument("--scales", default="1,10",
+                        help="Comma-separated corpus multipliers; 1 ≈ today's corpus (default: 1,10)")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Passed to the converter (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus generator seed (default: 0)")
+    parser.add_argument("--warm", action="store_true", help="Also time a second run against the build cache")
+    parser.add_argument("--workdir", help="Keep generated trees here and reuse them across runs")
+    parser.add_argument("--output", help="Save results as JSON")
+    parser.add_argument("--baseline", help="Results JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Allowed throughput drop vs --baseline (default: 0.10)")
+    parser.add_argument("extra", nargs=argparse.REMAINDER,
+                        help="Converter flags after --, e.g. -- --zstd --shard-size 4MB")
+    args = parser.parse_args()
+    scales = [int(s) for s in args.scales.split(",")]
+    extra = args.extra[1:] if args.extra[:1] == ["--"] else args.extra
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_convert_")
+    results = []
+    try:
+        for scale in scales:
+            root = os.path.join(workdir, f"scale-{scale}-seed-{args.seed}")
+            stamp = os.path.join(root, "inputs.json")
+            if os.path.exists(stamp):
+                with open(stamp) as f:
+                    inputs = json.load(f)
+                print(f"Scale {scale}: reusing {root}")
+            else:
+                print(f"Scale {scale}: generating inputs in {root} ...")
+                shutil.rmtree(root, ignore_errors=True)
+                inputs = generate_tree(root, scale, args.seed)
+                with open(stamp, "w") as f:
+                    json.dump(inputs, f)
+            out_dir = os.path.join(root, "out")
+            shutil.rmtree(out_dir, ignore_errors=True)  # and the build cache inside it
+
+            for label in ["cold", "warm"] if args.warm else ["cold"]:
+                print(f"  converting ({label}) ...")
+                metrics = run_converter(root, out_dir, args.jobs, extra)
+                result = summarize(scale, inputs, metrics)
+                result["run"] = f"{scale}x" + ("" if label == "cold" else f"/{label}")
+                results.append(result)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"jobs": args.jobs, "seed": args.seed, "extra": extra, "results": results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.baseline and not compare(results, args.baseline, args.tolerance, args.jobs, extra):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,21 +12,50 @@ Sources:
   7. Gerbil doc/guide     - Official guide (intro, FFI)
   8. Gerbil source code   - .ss implementation files with doc comments
 
-Output formats:
-  - training_data.jsonl  (ChatML / ShareGPT format for most LoRA tools)
-  - training_data_alpaca.jsonl (Alpaca format: instruction/input/output)
+Output formats (written together in one streaming pass):
+  - training_data.jsonl          (ChatML / ShareGPT format for most LoRA tools)
+  - training_data_together.jsonl (Together AI messages format)
+  - training_data_alpaca.jsonl   (Alpaca format: instruction/input/output)
+  - training_data_alpaca.json    (Alpaca entries as one JSON array)
 
 Each entry is a single-turn or multi-turn conversation teaching
 the model about Gerbil Scheme.
+
+Usage:
+  python3 convert_training_data.py            # serial
+  python3 convert_training_data.py --jobs 8   # convert across 8 processes
+  python3 convert_training_data.py --jobs 0   # one process per CPU
+  python3 convert_training_data.py --only error-fixes   # refresh one source, keep the rest
+  python3 convert_training_data.py --list-sources
+  python3 convert_training_data.py --watch      # rebuild whenever a source file changes
+
+Parallel runs produce byte-identical output to serial runs: every source is
+split into per-file tasks, and results are collected in task order.
 """
 
+import argparse
+import codecs
 import json
 import os
+import random
 import re
+import sys
 import glob
 import hashlib
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, groupby, islice
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+try:
+    import resource  # peak RSS; not available on Windows
+except ImportError:
+    resource = None
 
 # ── Paths ────────────────────────────────────────────────────────────
 MCP_DIR     = os.path.expanduser("~/mine/gerbil-mcp")
@@ -34,6 +63,17 @@ GERBIL_DIR  = os.path.expanduser("~/mine/gerbil")
 GAMBIT_DIR  = os.path.expanduser("~/mine/gambit")
 OUTPUT_DIR  = os.path.expanduser("~/mine/gerbil-lora")
 
+
+def set_source_dirs(mcp_dir: str, gerbil_dir: str, gambit_dir: str):
+    """Point the converters at other checkouts (--mcp-dir etc.).
+
+    Also the worker initializer, so pool processes see the same paths
+    whatever the multiprocessing start method.
+    """
+    global MCP_DIR, GERBIL_DIR, GAMBIT_DIR
+    MCP_DIR, GERBIL_DIR, GAMBIT_DIR = mcp_dir, gerbil_dir, gambit_dir
+    forget_sources()
+
 SYSTEM_PROMPT = (
     "You are an expert in Gerbil Scheme, a dialect of Scheme built on Gambit. "
     "You provide accurate, idiomatic Gerbil code with correct imports, function "
@@ -44,6 +84,361 @@ SYSTEM_PROMPT = (
 )
 
 
+class Example(NamedTuple):
+    """One training example, as emitted by every converter.
+
+    The ChatML, Together and Alpaca forms are rendered from this record only
+    when writing output, so each large answer string is held once.
+    """
+    source: str
+    question: str
+    answer: str
+    system: Optional[str] = None  # None means SYSTEM_PROMPT
+
+
+def to_chatml(ex: Example) -> dict:
+    """Render a ChatML/ShareGPT format entry."""
+    return {
+        "conversations": [
+            {"role": "system", "content": ex.system or SYSTEM_PROMPT},
+            {"role": "user", "content": ex.question},
+            {"role": "assistant", "content": ex.answer},
+        ],
+        "source": ex.source,
+    }
+
+
+def to_together(ex: Example) -> dict:
+    """Render a Together AI entry: {"messages": [...]}, no extra fields."""
+    return {"messages": to_chatml(ex)["conversations"]}
+
+
+def to_alpaca(ex: Example) -> dict:
+    """Render an Alpaca format entry."""
+    return {
+        "instruction": ex.question,
+        "input": "",
+        "output": ex.answer,
+        "source": ex.source,
+    }
+
+
+# ── Instrumentation ────────────────────────────────────────────────────
+#
+# Cheap counters and meters behind the metrics report (see Main). Reads and
+# gerbilizing happen inside the converters, possibly in worker processes, so
+# they bump per-process COUNTERS that run_task snapshots around each task.
+
+COUNTERS = {"read_s": 0.0, "read_bytes": 0, "gerbilize_s": 0.0}
+
+
+def peak_rss_kb() -> int:
+    """Peak resident set size of this process so far, in KiB (0 if unknown)."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS
+
+
+class Meter:
+    """Accumulates wall time, CPU time and peak-RSS growth over `with` blocks
+    (or start/stop pairs)."""
+
+    def __init__(self):
+        self.wall = self.cpu = 0.0
+        self.rss_kb = 0
+        self.items = 0  # entries passed through, when used by metered()
+
+    def start(self) -> "Meter":
+        self._start = (time.perf_counter(), time.process_time(), peak_rss_kb())
+        return self
+
+    def stop(self):
+        wall, cpu, rss = self._start
+        self.wall += time.perf_counter() - wall
+        self.cpu += time.process_time() - cpu
+        self.rss_kb += peak_rss_kb() - rss
+
+    __enter__ = start
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def metered(iterable, meter: Meter):
+    """Pass items through, charging the time spent producing each one to meter.
+
+    The charge includes the stages upstream of iterable; main() subtracts
+    them to get each stage's own share.
+    """
+    it = iter(iterable)
+    while True:
+        with meter:
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        meter.items += 1
+        yield item
+
+
+# ── Source file index and content cache ────────────────────────────────
+#
+# The source trees are walked once with os.scandir; task listers query the
+# index instead of globbing the same trees over and over, which is slow on
+# network-mounted checkouts. A root is only walked when something under it is
+# first asked for, so a run limited with --only skips unrelated trees. File
+# contents go through a bounded LRU cache so a file read by several converters
+# (reference docs, tutorials) and by the build cache's hashing is read from
+# disk once per process.
+
+class FileInfo(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    kind: str  # extension without the dot: "md", "ss", "scm", ...
+
+
+class FileIndex:
+    """In-memory index of every file under a set of roots, one walk per root."""
+
+    def __init__(self, roots: list[str]):
+        self.dirs = {}    # directory → [FileInfo] of the files directly in it
+        self.files = {}   # path → FileInfo
+        self.seen = set() # (dev, inode) of walked directories, against symlink loops
+        self.pending = [os.path.normpath(root) for root in roots]
+
+    def _load(self, path: str):
+        """Walk the roots that overlap path, if not done yet."""
+        for root in list(self.pending):
+            if path == root or path.startswith(root + os.sep) or root.startswith(path + os.sep):
+                self.pending.remove(root)
+                self._walk(root, self.seen)
+
+    def _walk(self, directory: str, seen: set):
+        try:
+            st = os.stat(directory)
+            if (st.st_dev, st.st_ino) in seen:
+                return
+            seen.add((st.st_dev, st.st_ino))
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            return
+        files = self.dirs.setdefault(directory, [])
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    self._walk(entry.path, seen)
+                elif entry.is_file():
+                    st = entry.stat()
+                    info = FileInfo(entry.path, st.st_size, st.st_mtime_ns,
+                                    os.path.splitext(entry.name)[1].lstrip("."))
+                    files.append(info)
+                    self.files[entry.path] = info
+            except OSError:
+                continue
+        files.sort()
+
+    def isdir(self, path: str) -> bool:
+        path = os.path.normpath(path)
+        self._load(path)
+        return path in self.dirs
+
+    def exists(self, path: str) -> bool:
+        return self.stat(path) is not None
+
+    def stat(self, path: str) -> Optional[FileInfo]:
+        path = os.path.normpath(path)
+        self._load(path)
+        return self.files.get(path)
+
+    def find(self, directory: str, suffix: str = "", recursive: bool = False) -> list[str]:
+        """Paths of files in directory ending with suffix, sorted."""
+        directory = os.path.normpath(directory)
+        self._load(directory)
+        if recursive:
+            prefix = directory + os.sep
+            dirs = sorted(d for d in self.dirs if d == directory or d.startswith(prefix))
+        else:
+            dirs = [directory] if directory in self.dirs else []
+        return [info.path for d in dirs for info in self.dirs[d] if info.path.endswith(suffix)]
+
+
+_file_index = None
+
+
+def index_roots() -> list[str]:
+    """The parts of the source trees the converters read."""
+    return [
+        MCP_DIR,  # the JSON sources and src/resources
+        os.path.join(GERBIL_DIR, "doc"),
+        os.path.join(GERBIL_DIR, "src", "std"),
+        os.path.join(GERBIL_DIR, "src", "tutorial"),
+        os.path.join(GAMBIT_DIR, "examples"),
+    ]
+
+
+def file_index() -> FileIndex:
+    """The shared index; each root is walked on first use."""
+    global _file_index
+    if _file_index is None:
+        _file_index = FileIndex(index_roots())
+    return _file_index
+
+
+CONTENT_CACHE_BYTES = 64 << 20  # upper bound on file contents kept in memory
+STREAM_FILE_BYTES = 8 << 20     # larger files are hashed in pieces, not cached
+
+
+class ContentCache:
+    """Least-recently-used file contents, bounded by total size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()  # path → bytes
+
+    def read(self, path: str) -> bytes:
+        data = self.entries.get(path)
+        if data is not None:
+            self.entries.move_to_end(path)
+            return data
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) <= self.max_bytes:
+            self.entries[path] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self.size -= len(self.entries.popitem(last=False)[1])
+        return data
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+CONTENT_CACHE = ContentCache(CONTENT_CACHE_BYTES)
+
+
+def forget_sources():
+    """Drop the file index and every cached file content, so the next run sees edits."""
+    global _file_index
+    _file_index = None
+    CONTENT_CACHE.clear()
+    _markdown_docs.clear()
+
+
+def read_bytes(path: str) -> bytes:
+    start = time.perf_counter()
+    data = CONTENT_CACHE.read(path)
+    COUNTERS["read_s"] += time.perf_counter() - start
+    COUNTERS["read_bytes"] += len(data)
+    return data
+
+
+def read_text(path: str) -> str:
+    text = read_bytes(path).decode("utf-8")
+    if "\r" in text:
+        # Match text-mode open(): universal newlines
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def read_chunks(path: str, size: int = 1 << 20) -> Iterator[bytes]:
+    """A file's bytes in pieces, without adding them to the content cache."""
+    data = CONTENT_CACHE.entries.get(path)
+    if data is not None:
+        yield data
+        return
+    with open(path, "rb") as f:
+        while True:
+            start = time.perf_counter()
+            chunk = f.read(size)
+            COUNTERS["read_s"] += time.perf_counter() - start
+            COUNTERS["read_bytes"] += len(chunk)
+            if not chunk:
+                return
+            yield chunk
+
+
+# ── Streaming JSON arrays ──────────────────────────────────────────────
+#
+# The gerbil-mcp sources are each one big JSON array. Rather than parse the
+# whole file, iter_json_array decodes one element at a time with raw_decode
+# as the text arrives, so memory holds one record plus one read chunk.
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_SPACE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator:
+    """Yield the elements of the JSON array in `path`, reading it incrementally."""
+    chunks = read_chunks(path, chunk_size)
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buf, pos, offset, eof = "", 0, 0, False  # offset: chars dropped from buf
+
+    def more() -> bool:
+        nonlocal buf, pos, offset, eof
+        if eof:
+            return False
+        if pos > chunk_size:
+            buf, offset, pos = buf[pos:], offset + pos, 0
+        chunk = next(chunks, None)
+        eof = chunk is None
+        buf += decoder.decode(chunk or b"", final=eof)
+        return True
+
+    def token() -> str:
+        """Next non-space character (not consumed), or "" at end of file."""
+        nonlocal pos
+        while True:
+            pos = _JSON_SPACE.match(buf, pos).end()
+            if pos < len(buf) or not more():
+                return buf[pos:pos + 1]
+
+    def fail(expected: str):
+        found = repr(buf[pos:pos + 20]) if pos < len(buf) else "end of file"
+        raise ValueError(f"{path}: expected {expected} at char {offset + pos}, found {found}")
+
+    if token() != "[":
+        fail("a JSON array")
+    pos += 1
+    if token() == "]":
+        return
+    while True:
+        token()
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                # Most likely the element runs past what has been read so far.
+                # Read until the pending text doubles, so a long element is
+                # re-parsed a logarithmic number of times.
+                want = 2 * (len(buf) - pos) + chunk_size
+                grew = False
+                while len(buf) - pos < want and more():
+                    grew = True
+                if grew:
+                    continue
+                raise ValueError(f"{path}: {e.msg} (char {offset + e.pos})") from None
+            # A number cut off by the end of a chunk ("-2." of "-2.5") still
+            # decodes; only trust a value once the text after it is in sight
+            if (end < len(buf) and buf[end] in " \t\n\r,]") or not more():
+                break
+        pos = end
+        yield value
+        sep = token()
+        if sep == "]":
+            break
+        if sep != ",":
+            fail("',' or ']'")
+        pos += 1
+    pos += 1
+    if token():
+        fail("end of file")
+
+
 def normalize_code(code: str) -> str:
     """Normalize escaped newlines and clean up code strings."""
     code = code.replace("\\n", "\n")
@@ -54,35 +449,109 @@ def normalize_code(code: str) -> str:
     return code.strip()
 
 
+# ── Gerbilize: define → def inside Scheme code only ────────────────────
+#
+# Answers are markdown. Only fenced code blocks tagged as Scheme (or untagged)
+# are code; prose, inline `code` spans and other languages are left alone.
+# Inside code, strings, comments, character literals and |symbols| are split
+# out so only the heads of real forms are rewritten. Every scan is a single
+# regex pass done in C; Python only glues the pieces back together.
+
+SCHEME_FENCE_LANGS = {"", "scheme", "scm", "ss", "gerbil", "lisp", "racket"}
+
+# Fence marker plus the rest of its line. The scan keys on the marker itself so
+# the regex engine can skip ahead; gerbilize_text checks it starts the line.
+# A literal ``` prefix scans several times faster than a [`~] charset, and
+# ~~~ fences are rare, so the general pattern is only used when needed.
+_BACKTICK_FENCE = re.compile(r'(```+)([^\n]*)')
+_ANY_FENCE = re.compile(r'(`{3,}|~{3,})([^\n]*)')
+
+# Lexical tokens that can contain "(define" without it being a form
+_SCHEME_SKIP = re.compile(r"""(
+    "(?:[^"\\]|\\.)*(?:"|\Z)            # string literal
+  | \#\|.*?(?:\|\#|\Z)                 # block comment
+  | ;[^\n]*                            # line comment
+  | \#\\(?:[a-zA-Z]\w*|.)              # character literal: #\space, #\(
+  | \|(?:[^|\\]|\\.)*(?:\||\Z)         # |symbol|
+)""", re.S | re.X)
+
+_DELIM = r'(?=[\s()\[\]";\0]|\Z)'   # \0 joins code pieces in gerbilize_code
+_HEAD_RE = re.compile(r'\(define(?:-macro)?' + _DELIM)
+_DEFINE_HEAD = re.compile(r'\(define' + _DELIM)               # (define (f x) ...) → (def (f x) ...)
+_DEFINE_MACRO_HEAD = re.compile(r'\(define-macro' + _DELIM)   # rare in training data but worth catching
+
+
+def _rewrite_heads(code: str) -> str:
+    code = _DEFINE_HEAD.sub("(def", code)
+    if "(define-macro" in code:
+        code = _DEFINE_MACRO_HEAD.sub("(defmacro", code)
+    return code
+
+
+def gerbilize_code(code: str) -> str:
+    """Rewrite `define`/`define-macro` form heads in Scheme source."""
+    if not _HEAD_RE.search(code):
+        return code
+    # Even pieces are code, odd pieces are strings/comments/etc.
+    pieces = _SCHEME_SKIP.split(code)
+    if "\0" in code:
+        pieces[0::2] = [_rewrite_heads(p) for p in pieces[0::2]]
+    else:
+        pieces[0::2] = _rewrite_heads("\0".join(pieces[0::2])).split("\0")
+    return "".join(pieces)
+
+
 def gerbilize_text(text: str) -> str:
-    """Convert non-idiomatic Scheme patterns to idiomatic Gerbil in text.
+    """Convert non-idiomatic Scheme definitions to idiomatic Gerbil in markdown.
 
     Gerbil uses `def` not `define`, `defmacro`/`defrule` not `define-macro`, etc.
-    This runs on assistant message content to ensure the model learns Gerbil idioms.
+    This runs on assistant message content to ensure the model learns Gerbil
+    idioms, touching only Scheme code blocks.
     """
-    # (define (name args) body) → (def (name args) body)
-    # (define name value) → (def name value)
-    # But NOT define-class, define-type, etc. — only bare `define`
-    text = re.sub(r'\(define\s+(?!\w*-)', '(def ', text)
-    # (define-macro → (defmacro  (rare in training data but worth catching)
-    text = text.replace('(define-macro ', '(defmacro ')
-    return text
-
-
-def gerbilize_entry(entry: dict) -> dict:
-    """Apply gerbilize_text to all assistant messages in a ChatML entry."""
-    new_convos = []
-    for msg in entry["conversations"]:
-        if msg["role"] == "assistant":
-            new_convos.append({**msg, "content": gerbilize_text(msg["content"])})
-        else:
-            new_convos.append(msg)
-    return {**entry, "conversations": new_convos}
-
-
-def gerbilize_alpaca(entry: dict) -> dict:
-    """Apply gerbilize_text to the output field of an Alpaca entry."""
-    return {**entry, "output": gerbilize_text(entry["output"])}
+    if not _HEAD_RE.search(text):
+        return text
+
+    out = []
+    pos = 0           # text[:pos] has been emitted
+    fence = None      # marker of the open fence, if inside one
+    fence_re = _ANY_FENCE if "~~~" in text else _BACKTICK_FENCE
+    for m in fence_re.finditer(text):
+        line_start = text.rfind("\n", 0, m.start()) + 1
+        indent = text[line_start:m.start()]
+        if len(indent) > 3 or indent.strip(" \t"):
+            continue  # marker not at the start of its line
+        marker, info = m.group(1, 2)
+        if fence is None:
+            if marker[0] == "`" and "`" in info:
+                continue  # inline code span, not a fence
+            fence = marker
+            lang = info.split()[0].lower() if info.strip() else ""
+            body_start = m.end() + 1
+        elif marker[0] == fence[0] and len(marker) >= len(fence) and not info.strip():
+            body_end = max(body_start, line_start - 1)
+            body = text[body_start:body_end]
+            out.append(text[pos:body_start])
+            out.append(gerbilize_code(body) if lang in SCHEME_FENCE_LANGS else body)
+            pos = body_end
+            fence = None
+
+    if fence is not None:
+        # An unclosed fence runs to the end of the text
+        body = text[body_start:]
+        out.append(text[pos:body_start])
+        out.append(gerbilize_code(body) if lang in SCHEME_FENCE_LANGS else body)
+        pos = len(text)
+
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def make_example(source: str, question: str, answer: str) -> Example:
+    """Create an Example, gerbilizing the answer as it is built."""
+    start = time.perf_counter()
+    answer = gerbilize_text(answer)
+    COUNTERS["gerbilize_s"] += time.perf_counter() - start
+    return Example(source, question, answer)
 
 
 # ═══════════════════════════════════════════════════════════════════════
@@ -113,55 +582,26 @@ CONVENTION_EXAMPLES = [
 ]
 
 
-def generate_convention_entries() -> tuple[list, list]:
+def generate_convention_entries() -> list[Example]:
     """Generate training entries that teach Gerbil-specific conventions."""
-    chatml_entries = []
-    alpaca_entries = []
+    entries = []
 
     for i, ex in enumerate(CONVENTION_EXAMPLES):
-        # Repeat each convention example 3x to increase weight
-        for rep in range(3):
-            source_id = f"convention:gerbil-idiom-{i}:rep{rep}"
-            chatml_entries.append(make_chatml([
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": ex["q"]},
-                {"role": "assistant", "content": ex["a"]},
-            ], source_id))
-            alpaca_entries.append(make_alpaca(
-                instruction=ex["q"],
-                output=ex["a"],
-                source_id=source_id,
-            ))
-
-    return chatml_entries, alpaca_entries
-
-
-def make_chatml(conversations: list[dict], source_id: str) -> dict:
-    """Create a ChatML/ShareGPT format entry."""
-    return {
-        "conversations": conversations,
-        "source": source_id,
-    }
+        # Written in idiomatic Gerbil already; the "avoid" snippets must keep
+        # their `define`, so these skip gerbilize. They get their extra weight
+        # from the training mix (DEFAULT_MIX_WEIGHTS), not from repeats.
+        entries.append(Example(f"convention:gerbil-idiom-{i}", ex["q"], ex["a"]))
 
-
-def make_alpaca(instruction: str, output: str, inp: str = "", source_id: str = "") -> dict:
-    """Create an Alpaca format entry."""
-    return {
-        "instruction": instruction,
-        "input": inp,
-        "output": output,
-        "source": source_id,
-    }
+    return entries
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 1: Cookbook Recipes
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_cookbooks(recipes: list[dict]) -> tuple[list, list]:
+def convert_cookbooks(recipes: Iterable[dict]) -> list[Example]:
     """Convert cookbook recipes into training pairs."""
-    chatml_entries = []
-    alpaca_entries = []
+    entries = []
 
     for r in recipes:
         if r.get("deprecated"):
@@ -185,13 +625,7 @@ def convert_cookbooks(recipes: list[dict]) -> tuple[list, list]:
             answer_parts.append(f"\n**Notes:** {notes}")
         answer = "\n\n".join(answer_parts)
 
-        chatml_entries.append(make_chatml([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": question},
-            {"role": "assistant", "content": answer},
-        ], f"cookbook:{rid}:howto"))
-
-        alpaca_entries.append(make_alpaca(question, answer, source_id=f"cookbook:{rid}:howto"))
+        entries.append(make_example(f"cookbook:{rid}:howto", question, answer))
 
         # ── Variant 2: "Show me an example of..." ──────────────────
         example_q = f"Show me an example of {title.lower().rstrip('.')} in Gerbil Scheme."
@@ -199,13 +633,7 @@ def convert_cookbooks(recipes: list[dict]) -> tuple[list, list]:
         if notes:
             example_a += f"\n\n{notes}"
 
-        chatml_entries.append(make_chatml([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": example_q},
-            {"role": "assistant", "content": example_a},
-        ], f"cookbook:{rid}:example"))
-
-        alpaca_entries.append(make_alpaca(example_q, example_a, source_id=f"cookbook:{rid}:example"))
+        entries.append(make_example(f"cookbook:{rid}:example", example_q, example_a))
 
         # ── Variant 3: "What imports do I need for..." ──────────────
         if imports:
@@ -215,13 +643,7 @@ def convert_cookbooks(recipes: list[dict]) -> tuple[list, list]:
             if notes and "import" in notes.lower():
                 import_a += f"\n\n{notes}"
 
-            chatml_entries.append(make_chatml([
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": import_q},
-                {"role": "assistant", "content": import_a},
-            ], f"cookbook:{rid}:imports"))
-
-            alpaca_entries.append(make_alpaca(import_q, import_a, source_id=f"cookbook:{rid}:imports"))
+            entries.append(make_example(f"cookbook:{rid}:imports", import_q, import_a))
 
         # ── Variant 4: Gotcha recipes get "What's wrong with..." ────
         if "gotcha" in tags or "GOTCHA" in title.upper():
@@ -232,25 +654,18 @@ def convert_cookbooks(recipes: list[dict]) -> tuple[list, list]:
                 gotcha_q = f"What's a common mistake when {' '.join(tags[:3])} in Gerbil Scheme?"
                 gotcha_a = f"**Common mistake:**\n\n```scheme\n{wrong_code}\n```\n\n**The fix:** {notes}"
 
-                chatml_entries.append(make_chatml([
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": gotcha_q},
-                    {"role": "assistant", "content": gotcha_a},
-                ], f"cookbook:{rid}:gotcha"))
-
-                alpaca_entries.append(make_alpaca(gotcha_q, gotcha_a, source_id=f"cookbook:{rid}:gotcha"))
+                entries.append(make_example(f"cookbook:{rid}:gotcha", gotcha_q, gotcha_a))
 
-    return chatml_entries, alpaca_entries
+    return entries
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 2: Security Rules
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_security_rules(rules: list[dict]) -> tuple[list, list]:
+def convert_security_rules(rules: Iterable[dict]) -> list[Example]:
     """Convert security rules into training pairs about safe Gerbil coding."""
-    chatml_entries = []
-    alpaca_entries = []
+    entries = []
 
     for rule in rules:
         rid = rule["id"]
@@ -270,37 +685,24 @@ def convert_security_rules(rules: list[dict]) -> tuple[list, list]:
             f"**Fix:** {remediation}"
         )
 
-        chatml_entries.append(make_chatml([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": q},
-            {"role": "assistant", "content": a},
-        ], f"security:{rid}"))
-
-        alpaca_entries.append(make_alpaca(q, a, source_id=f"security:{rid}"))
+        entries.append(make_example(f"security:{rid}", q, a))
 
         # ── Variant 2: "Is this safe?" pattern ─────────────────────
         safe_q = f"Is it safe to use {' '.join(tags[:3])} in Gerbil FFI code? What should I watch out for?"
         safe_a = f"{message}\n\n**Remediation:** {remediation}"
 
-        chatml_entries.append(make_chatml([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": safe_q},
-            {"role": "assistant", "content": safe_a},
-        ], f"security:{rid}:safe"))
+        entries.append(make_example(f"security:{rid}:safe", safe_q, safe_a))
 
-        alpaca_entries.append(make_alpaca(safe_q, safe_a, source_id=f"security:{rid}:safe"))
-
-    return chatml_entries, alpaca_entries
+    return entries
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 3: Error Fixes
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_error_fixes(fixes: list[dict]) -> tuple[list, list]:
+def convert_error_fixes(fixes: Iterable[dict]) -> list[Example]:
     """Convert error→fix mappings into training pairs."""
-    chatml_entries = []
-    alpaca_entries = []
+    entries = []
 
     for fix in fixes:
         if fix["id"].startswith("test-"):
@@ -320,79 +722,144 @@ def convert_error_fixes(fixes: list[dict]) -> tuple[list, list]:
             a_parts.append(f"**Correct:**\n```scheme\n{normalize_code(code_example)}\n```")
         a = "\n\n".join(a_parts)
 
-        chatml_entries.append(make_chatml([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": q},
-            {"role": "assistant", "content": a},
-        ], f"errorfix:{fix['id']}"))
-
-        alpaca_entries.append(make_alpaca(q, a, source_id=f"errorfix:{fix['id']}"))
+        entries.append(make_example(f"errorfix:{fix['id']}", q, a))
 
-    return chatml_entries, alpaca_entries
+    return entries
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 4: Markdown Reference Documents
 # ═══════════════════════════════════════════════════════════════════════
 
-def split_markdown_sections(content: str) -> list[tuple[str, str]]:
-    """Split markdown into (heading, content) sections."""
-    sections = []
-    lines = content.split("\n")
-    current_heading = ""
-    current_body = []
-
-    for line in lines:
-        if line.startswith("#"):
-            if current_heading or current_body:
-                sections.append((current_heading, "\n".join(current_body).strip()))
-            current_heading = line.lstrip("#").strip()
-            current_body = []
-        else:
-            current_body.append(line)
+# ── Markdown section tree ───────────────────────────────────────────────
+#
+# Reference docs feed both the doc-level and the API-level generators, so
+# each file is parsed once into a list of headings and the offsets where
+# their bodies end, and the parse is cached. The scan only visits lines that
+# start with "#" or a fence marker, and lines inside fenced code are never
+# headings (Scheme and shell comments in examples start with "#" too).
+
+# A heading at column 0, or a fence line with up to 3 spaces of indentation.
+# Matched against "\n" + text: the literal "\n" prefix lets re skip from line
+# to line, about 3x faster than a ^ anchor under MULTILINE
+_MD_BLOCK_LINE = re.compile(r'\n(?:(#{1,6})(?=[ \t\n]|\Z)| {0,3}(`{3,}|~{3,})([^\n]*))')
+MARKDOWN_CACHE_DOCS = 32  # parsed files kept per process
+
+
+class MarkdownSection(NamedTuple):
+    level: int        # 1-6; 0 for the text before the first heading
+    title: str
+    start: int        # offset of the heading line
+    body_start: int   # offset just past the heading line
+    body_end: int     # start of the next heading of any level
+    end: int          # start of the next heading at this level or above: end of the subtree
+    parent: int       # index of the enclosing section, -1 at the top
+
+
+class MarkdownDoc:
+    """A markdown text and its section tree, built in one linear pass."""
+
+    def __init__(self, text: str):
+        self.text = text
+        heads = []   # (level, title, start, body_start)
+        fence = None
+        for m in _MD_BLOCK_LINE.finditer("\n" + text):  # m.start() is the line's offset in text
+            marker = m.group(2)
+            if fence is not None:
+                # Inside a fence only its closing line matters
+                if marker and marker[0] == fence[0] and len(marker) >= len(fence) and not m.group(3).strip():
+                    fence = None
+            elif marker:
+                if not (marker[0] == "`" and "`" in m.group(3)):  # backtick info strings can't hold backticks
+                    fence = marker
+            else:
+                line_end = text.find("\n", m.end() - 1)
+                line_end = len(text) if line_end < 0 else line_end
+                heads.append((len(m.group(1)), text[m.start():line_end].lstrip("#").strip(),
+                              m.start(), min(line_end + 1, len(text))))
+
+        # Walk backwards tracking the next heading at each level, so every
+        # "where does this end at level <= k" answer is O(1)
+        self._ends = [None] * len(heads)
+        following = [len(text)] * 7
+        for i in range(len(heads) - 1, -1, -1):
+            ends, nearest = [], len(text)
+            for level in range(1, 7):
+                nearest = min(nearest, following[level])
+                ends.append(nearest)
+            self._ends[i] = ends
+            following[heads[i][0]] = heads[i][2]
+
+        self.sections = []
+        first = heads[0][2] if heads else len(text)
+        if first > 0 or not heads:
+            self.sections.append(MarkdownSection(0, "", 0, 0, first, first, -1))
+            self._ends.insert(0, [first] * 6)
+        stack = []  # indices of open sections, shallowest first
+        for level, title, start, body_start in heads:
+            ends = self._ends[len(self.sections)]
+            while stack and self.sections[stack[-1]].level >= level:
+                stack.pop()
+            self.sections.append(MarkdownSection(level, title, start, body_start, ends[5], ends[level - 1],
+                                                 stack[-1] if stack else -1))
+            stack.append(len(self.sections) - 1)
+
+    def body(self, i: int, until_level: int = 6) -> str:
+        """Section i's text up to the next heading at until_level or above."""
+        return self.text[self.sections[i].body_start:self._ends[i][until_level - 1]]
+
+
+_markdown_docs = OrderedDict()  # path → (source bytes, MarkdownDoc)
+
+
+def markdown_doc(path: str) -> MarkdownDoc:
+    """The parsed markdown file, reusing the parse while its contents are cached."""
+    data = read_bytes(path)
+    hit = _markdown_docs.get(path)
+    if hit is not None and hit[0] is data:  # same bytes object from CONTENT_CACHE
+        _markdown_docs.move_to_end(path)
+        return hit[1]
+    doc = MarkdownDoc(read_text(path))
+    _markdown_docs[path] = (data, doc)
+    if len(_markdown_docs) > MARKDOWN_CACHE_DOCS:
+        _markdown_docs.popitem(last=False)
+    return doc
 
-    if current_heading or current_body:
-        sections.append((current_heading, "\n".join(current_body).strip()))
 
-    return sections
+def split_markdown_sections(content: str) -> list[tuple[str, str]]:
+    """Split markdown into (heading, content) sections."""
+    doc = content if isinstance(content, MarkdownDoc) else MarkdownDoc(content)
+    return [(sec.title, doc.body(i).strip()) for i, sec in enumerate(doc.sections)]
 
 
-def convert_markdown_doc(filepath: str, doc_type: str = "reference") -> tuple[list, list]:
+def convert_markdown_doc(filepath: str, doc_type: str = "reference") -> list[Example]:
     """Convert a markdown documentation file into training pairs."""
-    chatml_entries = []
-    alpaca_entries = []
+    entries = []
 
     try:
-        with open(filepath, "r") as f:
-            content = f.read()
+        doc = markdown_doc(filepath)
     except (FileNotFoundError, PermissionError):
-        return chatml_entries, alpaca_entries
+        return entries
+    content = doc.text
 
     if not content.strip():
-        return chatml_entries, alpaca_entries
+        return entries
 
     relpath = os.path.relpath(filepath, GERBIL_DIR) if filepath.startswith(GERBIL_DIR) else os.path.basename(filepath)
     source_id = f"doc:{relpath}"
 
-    # Full document as a single training entry
-    # Only for reasonably sized docs (< 8000 chars)
-    if len(content) < 8000:
-        doc_title = ""
-        first_line = content.strip().split("\n")[0]
-        if first_line.startswith("#"):
-            doc_title = first_line.lstrip("#").strip()
-
-        if doc_title:
-            q = f"Explain {doc_title} in Gerbil Scheme."
-            chatml_entries.append(make_chatml([
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": q},
-                {"role": "assistant", "content": content.strip()},
-            ], f"{source_id}:full"))
-            alpaca_entries.append(make_alpaca(q, content.strip(), source_id=f"{source_id}:full"))
+    # Full document as a single training entry (long docs are chunked later)
+    doc_title = ""
+    first_line = content.strip().split("\n")[0]
+    if first_line.startswith("#"):
+        doc_title = first_line.lstrip("#").strip()
+
+    if doc_title:
+        q = f"Explain {doc_title} in Gerbil Scheme."
+        entries.append(make_example(f"{source_id}:full", q, content.strip()))
 
     # Section-level entries for larger docs
-    sections = split_markdown_sections(content)
+    sections = split_markdown_sections(doc)
     for heading, body in sections:
         if not heading or not body or len(body) < 100:
             continue
@@ -402,45 +869,40 @@ def convert_markdown_doc(filepath: str, doc_type: str = "reference") -> tuple[li
             continue
 
         q = f"Explain {heading} in Gerbil Scheme."
-        chatml_entries.append(make_chatml([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": q},
-            {"role": "assistant", "content": body},
-        ], f"{source_id}:{heading[:40]}"))
-
-        alpaca_entries.append(make_alpaca(q, body, source_id=f"{source_id}:{heading[:40]}"))
+        entries.append(make_example(f"{source_id}:{heading[:40]}", q, body))
 
-    return chatml_entries, alpaca_entries
+    return entries
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 5: API Reference Docs (structured function docs)
 # ═══════════════════════════════════════════════════════════════════════
 
-def extract_api_entries(filepath: str) -> tuple[list, list]:
+_API_HEADING = re.compile(r'`?([a-zA-Z_!?*<>=+\-/][a-zA-Z0-9_!?*<>=+\-/]*)`?')
+
+
+def extract_api_entries(filepath: str) -> list[Example]:
     """Extract individual API function docs from reference markdown files."""
-    chatml_entries = []
-    alpaca_entries = []
+    entries = []
 
     try:
-        with open(filepath, "r") as f:
-            content = f.read()
+        doc = markdown_doc(filepath)
     except (FileNotFoundError, PermissionError):
-        return chatml_entries, alpaca_entries
+        return entries
 
     relpath = os.path.relpath(filepath, GERBIL_DIR)
     source_id = f"api:{relpath}"
 
-    # Find function/macro documentation blocks
-    # Pattern: ### `function-name` or ### function-name followed by description
-    pattern = re.compile(
-        r'^#{2,3}\s+`?([a-zA-Z_!?*<>=+\-/][a-zA-Z0-9_!?*<>=+\-/]*)`?\s*\n(.*?)(?=^#{2,3}\s|\Z)',
-        re.MULTILINE | re.DOTALL
-    )
-
-    for match in pattern.finditer(content):
-        func_name = match.group(1).strip()
-        func_doc = match.group(2).strip()
+    # Function/macro documentation blocks: ## or ### `function-name`, up to
+    # the next heading at level 3 or above (#### subsections belong to it)
+    for i, sec in enumerate(doc.sections):
+        if sec.level not in (2, 3):
+            continue
+        match = _API_HEADING.fullmatch(sec.title)
+        if not match:
+            continue
+        func_name = match.group(1)
+        func_doc = doc.body(i, until_level=3).strip()
 
         if len(func_doc) < 50:
             continue
@@ -458,34 +920,26 @@ def extract_api_entries(filepath: str) -> tuple[list, list]:
         if module:
             q += f" (from {module})"
 
-        chatml_entries.append(make_chatml([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": q},
-            {"role": "assistant", "content": func_doc},
-        ], f"{source_id}:{func_name}"))
-
-        alpaca_entries.append(make_alpaca(q, func_doc, source_id=f"{source_id}:{func_name}"))
+        entries.append(make_example(f"{source_id}:{func_name}", q, func_doc))
 
-    return chatml_entries, alpaca_entries
+    return entries
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 6: Tutorial Source Code
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_source_file(filepath: str, description: str = "") -> tuple[list, list]:
+def convert_source_file(filepath: str, description: str = "") -> list[Example]:
     """Convert a Gerbil source file into training entries."""
-    chatml_entries = []
-    alpaca_entries = []
+    entries = []
 
     try:
-        with open(filepath, "r") as f:
-            content = f.read()
+        content = read_text(filepath)
     except (FileNotFoundError, PermissionError):
-        return chatml_entries, alpaca_entries
+        return entries
 
     if not content.strip() or len(content) < 50:
-        return chatml_entries, alpaca_entries
+        return entries
 
     relpath = os.path.relpath(filepath, GERBIL_DIR) if filepath.startswith(GERBIL_DIR) else os.path.basename(filepath)
     source_id = f"source:{relpath}"
@@ -498,231 +952,201 @@ def convert_source_file(filepath: str, description: str = "") -> tuple[list, lis
     q = f"Show me an example implementation of {description} in Gerbil Scheme."
     a = f"Here's the implementation from `{relpath}`:\n\n```scheme\n{content.strip()}\n```"
 
-    chatml_entries.append(make_chatml([
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": q},
-        {"role": "assistant", "content": a},
-    ], f"{source_id}:full"))
+    entries.append(make_example(f"{source_id}:full", q, a))
 
-    alpaca_entries.append(make_alpaca(q, a, source_id=f"{source_id}:full"))
-
-    return chatml_entries, alpaca_entries
+    return entries
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 7: Tutorial Docs (narrative + code)
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_tutorial(filepath: str) -> tuple[list, list]:
+def convert_tutorial(filepath: str) -> list[Example]:
     """Convert tutorial markdown (narrative + inline code) into training pairs."""
-    chatml_entries = []
-    alpaca_entries = []
+    entries = []
 
     try:
-        with open(filepath, "r") as f:
-            content = f.read()
+        content = read_text(filepath)
     except (FileNotFoundError, PermissionError):
-        return chatml_entries, alpaca_entries
+        return entries
 
     relpath = os.path.relpath(filepath, GERBIL_DIR)
     source_id = f"tutorial:{relpath}"
 
-    # Full tutorial as a single training entry if small enough
-    if len(content) < 12000:
-        title = ""
-        first_line = content.strip().split("\n")[0]
-        if first_line.startswith("#"):
-            title = first_line.lstrip("#").strip()
-
-        if title:
-            q = f"Walk me through building {title.lower()} in Gerbil Scheme."
-            chatml_entries.append(make_chatml([
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": q},
-                {"role": "assistant", "content": content.strip()},
-            ], f"{source_id}:full"))
-            alpaca_entries.append(make_alpaca(q, content.strip(), source_id=f"{source_id}:full"))
+    # Full tutorial as a single training entry (long tutorials are chunked later)
+    title = ""
+    first_line = content.strip().split("\n")[0]
+    if first_line.startswith("#"):
+        title = first_line.lstrip("#").strip()
+
+    if title:
+        q = f"Walk me through building {title.lower()} in Gerbil Scheme."
+        entries.append(make_example(f"{source_id}:full", q, content.strip()))
 
     # Also create section-level entries
-    c, a = convert_markdown_doc(filepath, "tutorial")
-    chatml_entries.extend(c)
-    alpaca_entries.extend(a)
+    entries.extend(convert_markdown_doc(filepath, "tutorial"))
 
-    return chatml_entries, alpaca_entries
+    return entries
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 8: Gambit Documentation
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_gambit_examples() -> tuple[list, list]:
-    """Convert Gambit example files into training pairs about FFI and low-level features."""
-    chatml_entries = []
-    alpaca_entries = []
-
-    examples = {
-        "tcltk": "Tcl/Tk GUI integration via Gambit FFI",
-        "web-repl": "web-based REPL server",
-        "web-server": "HTTP web server",
-        "ring": "distributed ring topology",
-        "pthread": "POSIX thread integration",
-        "pi": "Pi computation",
-        "misc": "miscellaneous Gambit examples",
-    }
+GAMBIT_EXAMPLES = {
+    "tcltk": "Tcl/Tk GUI integration via Gambit FFI",
+    "web-repl": "web-based REPL server",
+    "web-server": "HTTP web server",
+    "ring": "distributed ring topology",
+    "pthread": "POSIX thread integration",
+    "pi": "Pi computation",
+    "misc": "miscellaneous Gambit examples",
+}
 
-    for dirname, description in examples.items():
-        dirpath = os.path.join(GAMBIT_DIR, "examples", dirname)
-        if not os.path.isdir(dirpath):
-            continue
-        for scm_file in glob.glob(os.path.join(dirpath, "*.scm")):
-            try:
-                with open(scm_file, "r") as f:
-                    content = f.read()
-            except:
-                continue
 
-            if len(content) < 50:
-                continue
+def convert_gambit_example(scm_file: str, dirname: str, description: str) -> list[Example]:
+    """Convert a single Gambit example file into a training pair."""
+    entries = []
+
+    try:
+        content = read_text(scm_file)
+    except:
+        return entries
+
+    if len(content) < 50:
+        return entries
 
-            basename = os.path.basename(scm_file)
-            source_id = f"gambit:examples/{dirname}/{basename}"
-            q = f"Show me a Gambit Scheme example of {description}."
-            a = f"Here's `{dirname}/{basename}` from the Gambit examples:\n\n```scheme\n{content.strip()}\n```"
+    basename = os.path.basename(scm_file)
+    source_id = f"gambit:examples/{dirname}/{basename}"
+    q = f"Show me a Gambit Scheme example of {description}."
+    a = f"Here's `{dirname}/{basename}` from the Gambit examples:\n\n```scheme\n{content.strip()}\n```"
 
-            chatml_entries.append(make_chatml([
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": q},
-                {"role": "assistant", "content": a},
-            ], source_id))
+    entries.append(make_example(source_id, q, a))
 
-            alpaca_entries.append(make_alpaca(q, a, source_id=source_id))
+    return entries
 
-    return chatml_entries, alpaca_entries
+
+def gambit_example_tasks() -> list[tuple]:
+    """List one conversion task per Gambit example file."""
+    tasks = []
+    for dirname, description in GAMBIT_EXAMPLES.items():
+        dirpath = os.path.join(GAMBIT_DIR, "examples", dirname)
+        for scm_file in file_index().find(dirpath, ".scm"):
+            tasks.append((convert_gambit_example, (scm_file, dirname, description), scm_file))
+    return tasks
+
+
+def convert_gambit_examples() -> list[Example]:
+    """Convert Gambit example files into training pairs about FFI and low-level features."""
+    return collect(gambit_example_tasks())
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 9: Gerbil Test Files (as usage examples)
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_test_files() -> tuple[list, list]:
-    """Convert Gerbil test files into training pairs showing API usage."""
-    chatml_entries = []
-    alpaca_entries = []
+def convert_test_file(tf: str) -> list[Example]:
+    """Convert a single Gerbil test file into a training pair."""
+    entries = []
 
-    test_files = glob.glob(os.path.join(GERBIL_DIR, "src/std/**/*-test.ss"), recursive=True)
+    try:
+        content = read_text(tf)
+    except:
+        return entries
 
-    for tf in test_files:
-        try:
-            with open(tf, "r") as f:
-                content = f.read()
-        except:
-            continue
+    if len(content) < 100:
+        return entries
 
-        if len(content) < 100 or len(content) > 15000:
-            continue
+    relpath = os.path.relpath(tf, GERBIL_DIR)
+    source_id = f"test:{relpath}"
 
-        relpath = os.path.relpath(tf, GERBIL_DIR)
-        source_id = f"test:{relpath}"
+    # Derive module name from test path
+    module_path = relpath.replace("src/std/", ":std/").replace("-test.ss", "").replace("/", "/")
 
-        # Derive module name from test path
-        module_path = relpath.replace("src/std/", ":std/").replace("-test.ss", "").replace("/", "/")
-        basename = os.path.basename(tf).replace("-test.ss", "")
+    q = f"Show me test examples for the {module_path} module in Gerbil Scheme."
+    a = f"Here are test examples from `{relpath}`:\n\n```scheme\n{content.strip()}\n```"
 
-        q = f"Show me test examples for the {module_path} module in Gerbil Scheme."
-        a = f"Here are test examples from `{relpath}`:\n\n```scheme\n{content.strip()}\n```"
+    entries.append(make_example(f"{source_id}:full", q, a))
 
-        chatml_entries.append(make_chatml([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": q},
-            {"role": "assistant", "content": a},
-        ], f"{source_id}:full"))
+    return entries
 
-        alpaca_entries.append(make_alpaca(q, a, source_id=f"{source_id}:full"))
 
-    return chatml_entries, alpaca_entries
+def test_file_tasks() -> list[tuple]:
+    """List one conversion task per std library test file."""
+    test_files = file_index().find(os.path.join(GERBIL_DIR, "src", "std"), "-test.ss", recursive=True)
+    return [(convert_test_file, (tf,), tf) for tf in test_files]
+
+
+def convert_test_files() -> list[Example]:
+    """Convert Gerbil test files into training pairs showing API usage."""
+    return collect(test_file_tasks())
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 10: Synthesized Q&A from Resource MDs
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_resource_mds() -> tuple[list, list]:
-    """Convert gerbil-mcp resource markdown files into focused Q&A pairs."""
-    chatml_entries = []
-    alpaca_entries = []
-
+def resource_md_tasks() -> list[tuple]:
+    """List one conversion task per gerbil-mcp resource markdown file."""
     resources_dir = os.path.join(MCP_DIR, "src", "resources")
-    if not os.path.isdir(resources_dir):
-        return chatml_entries, alpaca_entries
+    return [(convert_markdown_doc, (md_file, "resource"), md_file)
+            for md_file in file_index().find(resources_dir, ".md")]
 
-    for md_file in glob.glob(os.path.join(resources_dir, "*.md")):
-        c, a = convert_markdown_doc(md_file, "resource")
-        chatml_entries.extend(c)
-        alpaca_entries.extend(a)
 
-    return chatml_entries, alpaca_entries
+def convert_resource_mds() -> list[Example]:
+    """Convert gerbil-mcp resource markdown files into focused Q&A pairs."""
+    return collect(resource_md_tasks())
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 11: Guide documents (intro.md, ffi.md, etc.)
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_guide_docs() -> tuple[list, list]:
-    """Convert Gerbil guide docs into training pairs."""
-    chatml_entries = []
-    alpaca_entries = []
-
+def guide_doc_tasks() -> list[tuple]:
+    """List one conversion task per Gerbil guide doc."""
     guide_dir = os.path.join(GERBIL_DIR, "doc", "guide")
-    if not os.path.isdir(guide_dir):
-        return chatml_entries, alpaca_entries
+    return [(convert_markdown_doc, (md_file, "guide"), md_file)
+            for md_file in file_index().find(guide_dir, ".md")]
 
-    for md_file in glob.glob(os.path.join(guide_dir, "*.md")):
-        c, a = convert_markdown_doc(md_file, "guide")
-        chatml_entries.extend(c)
-        alpaca_entries.extend(a)
 
-    return chatml_entries, alpaca_entries
+def convert_guide_docs() -> list[Example]:
+    """Convert Gerbil guide docs into training pairs."""
+    return collect(guide_doc_tasks())
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 12: All reference docs
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_all_reference_docs() -> tuple[list, list]:
-    """Convert ALL reference documentation markdown files."""
-    chatml_entries = []
-    alpaca_entries = []
+def convert_reference_doc(md_file: str) -> list[Example]:
+    """Convert one reference doc into doc-level and API-level training pairs."""
+    # Full doc entries, then individual API function entries
+    return convert_markdown_doc(md_file, "reference") + extract_api_entries(md_file)
 
-    ref_dir = os.path.join(GERBIL_DIR, "doc", "reference")
-    if not os.path.isdir(ref_dir):
-        return chatml_entries, alpaca_entries
 
-    for md_file in glob.glob(os.path.join(ref_dir, "**", "*.md"), recursive=True):
-        # Full doc entries
-        c, a = convert_markdown_doc(md_file, "reference")
-        chatml_entries.extend(c)
-        alpaca_entries.extend(a)
+def reference_doc_tasks() -> list[tuple]:
+    """List one conversion task per reference markdown file."""
+    ref_dir = os.path.join(GERBIL_DIR, "doc", "reference")
+    return [(convert_reference_doc, (md_file,), md_file)
+            for md_file in file_index().find(ref_dir, ".md", recursive=True)]
 
-        # Individual API function entries
-        c2, a2 = extract_api_entries(md_file)
-        chatml_entries.extend(c2)
-        alpaca_entries.extend(a2)
 
-    return chatml_entries, alpaca_entries
+def convert_all_reference_docs() -> list[Example]:
+    """Convert ALL reference documentation markdown files."""
+    return collect(reference_doc_tasks())
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 13: Tutorial source code and docs
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_all_tutorials() -> tuple[list, list]:
-    """Convert tutorial source code and documentation."""
-    chatml_entries = []
-    alpaca_entries = []
+def tutorial_tasks() -> list[tuple]:
+    """List one conversion task per tutorial source file and tutorial doc."""
+    tasks = []
 
     # Tutorial source files
     tutorial_dir = os.path.join(GERBIL_DIR, "src", "tutorial")
-    if os.path.isdir(tutorial_dir):
+    if file_index().isdir(tutorial_dir):
         descriptions = {
             "httpd": "a simple HTTP server",
             "kvstore": "a key-value store with RPC",
@@ -730,273 +1154,1915 @@ def convert_all_tutorials() -> tuple[list, list]:
             "lang": "a custom language extension",
             "ensemble": "a distributed actor ensemble",
         }
-        for ss_file in glob.glob(os.path.join(tutorial_dir, "**", "*.ss"), recursive=True):
+        for ss_file in file_index().find(tutorial_dir, ".ss", recursive=True):
             # Determine description from directory
             parts = os.path.relpath(ss_file, tutorial_dir).split(os.sep)
             desc = descriptions.get(parts[0], parts[0]) if parts else "a tutorial"
-            c, a = convert_source_file(ss_file, desc)
-            chatml_entries.extend(c)
-            alpaca_entries.extend(a)
+            tasks.append((convert_source_file, (ss_file, desc), ss_file))
 
     # Tutorial docs
     tut_doc_dir = os.path.join(GERBIL_DIR, "doc", "tutorials")
-    if os.path.isdir(tut_doc_dir):
-        for md_file in glob.glob(os.path.join(tut_doc_dir, "*.md")):
-            c, a = convert_tutorial(md_file)
-            chatml_entries.extend(c)
-            alpaca_entries.extend(a)
+    for md_file in file_index().find(tut_doc_dir, ".md"):
+        tasks.append((convert_tutorial, (md_file,), md_file))
+
+    return tasks
+
 
-    return chatml_entries, alpaca_entries
+def convert_all_tutorials() -> list[Example]:
+    """Convert tutorial source code and documentation."""
+    return collect(tutorial_tasks())
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Source 14: Std library source code (key modules)
 # ═══════════════════════════════════════════════════════════════════════
 
-def convert_std_source_files() -> tuple[list, list]:
-    """Convert key standard library source files."""
-    chatml_entries = []
-    alpaca_entries = []
-
-    key_modules = {
-        "src/std/sugar.ss": "syntactic sugar (try/catch, hash, chain, when-let)",
-        "src/std/iter.ss": "the iteration framework (for, for/collect, in-range)",
-        "src/std/error.ss": "error handling and custom error classes",
-        "src/std/test.ss": "the unit testing framework",
-        "src/std/sort.ss": "sorting algorithms",
-        "src/std/event.ss": "the event system",
-        "src/std/coroutine.ss": "coroutines",
-        "src/std/amb.ss": "nondeterministic computation (amb operator)",
-        "src/std/generic.ss": "generic function dispatch",
-        "src/std/interface.ss": "interface definitions",
-        "src/std/actor.ss": "the actor system",
-        "src/std/misc/hash.ss": "extended hash table operations",
-        "src/std/misc/list.ss": "extended list operations",
-        "src/std/misc/string.ss": "extended string operations",
-        "src/std/misc/path.ss": "filesystem path operations",
-        "src/std/misc/channel.ss": "Go-style channels",
-        "src/std/misc/threads.ss": "thread utilities",
-        "src/std/misc/alist.ss": "association list operations",
-        "src/std/misc/bytes.ss": "byte vector operations",
-        "src/std/misc/process.ss": "process execution (run-process)",
-        "src/std/text/json.ss": "JSON parsing and generation",
-    }
+STD_KEY_MODULES = {
+    "src/std/sugar.ss": "syntactic sugar (try/catch, hash, chain, when-let)",
+    "src/std/iter.ss": "the iteration framework (for, for/collect, in-range)",
+    "src/std/error.ss": "error handling and custom error classes",
+    "src/std/test.ss": "the unit testing framework",
+    "src/std/sort.ss": "sorting algorithms",
+    "src/std/event.ss": "the event system",
+    "src/std/coroutine.ss": "coroutines",
+    "src/std/amb.ss": "nondeterministic computation (amb operator)",
+    "src/std/generic.ss": "generic function dispatch",
+    "src/std/interface.ss": "interface definitions",
+    "src/std/actor.ss": "the actor system",
+    "src/std/misc/hash.ss": "extended hash table operations",
+    "src/std/misc/list.ss": "extended list operations",
+    "src/std/misc/string.ss": "extended string operations",
+    "src/std/misc/path.ss": "filesystem path operations",
+    "src/std/misc/channel.ss": "Go-style channels",
+    "src/std/misc/threads.ss": "thread utilities",
+    "src/std/misc/alist.ss": "association list operations",
+    "src/std/misc/bytes.ss": "byte vector operations",
+    "src/std/misc/process.ss": "process execution (run-process)",
+    "src/std/text/json.ss": "JSON parsing and generation",
+}
+
+
+def convert_std_source_file(filepath: str, mod_path: str, description: str) -> list[Example]:
+    """Convert one key standard library source file into a training pair."""
+    entries = []
+
+    try:
+        content = read_text(filepath)
+    except:
+        return entries
 
-    for mod_path, description in key_modules.items():
+    if len(content) < 50:
+        return entries
+
+    # Large modules are kept whole here and split on form boundaries later
+    source_id = f"std-source:{mod_path}"
+    q = f"Show me the implementation of {description} in Gerbil's standard library."
+    a = f"Here's the source from `{mod_path}`:\n\n```scheme\n{content.strip()}\n```"
+
+    entries.append(make_example(f"{source_id}:full", q, a))
+
+    return entries
+
+
+def std_source_tasks() -> list[tuple]:
+    """List one conversion task per key standard library module."""
+    tasks = []
+    for mod_path, description in STD_KEY_MODULES.items():
         filepath = os.path.join(GERBIL_DIR, mod_path)
         # Some modules are just re-exports; try the api.ss variant too
-        if not os.path.exists(filepath):
+        if not file_index().exists(filepath):
             alt = filepath.replace(".ss", "/api.ss")
-            if os.path.exists(alt):
+            if file_index().exists(alt):
                 filepath = alt
             else:
                 continue
+        tasks.append((convert_std_source_file, (filepath, mod_path, description), filepath))
+    return tasks
 
-        try:
-            with open(filepath, "r") as f:
-                content = f.read()
-        except:
-            continue
 
-        if len(content) < 50:
-            continue
+def convert_std_source_files() -> list[Example]:
+    """Convert key standard library source files."""
+    return collect(std_source_tasks())
+
+
+# ═══════════════════════════════════════════════════════════════════════
+# Task Runner
+# ═══════════════════════════════════════════════════════════════════════
+#
+# Every source is described as a list of (function, args, input_path) tasks,
+# usually one per input file. Tasks are independent, so they can run in any
+# process; the results are always consumed in task order, which keeps the
+# output identical between serial and parallel runs. `input_path` is the file
+# the task reads (None for generated entries) and keys the build cache.
+
+def convert_json_source(convert, path: str) -> list[Example]:
+    """Run `convert` over a gerbil-mcp JSON file's records as they are parsed."""
+    return convert(iter_json_array(path))
+
+
+def json_source_task(convert, filename: str) -> tuple:
+    path = os.path.join(MCP_DIR, filename)
+    return (convert_json_source, (convert, path), path)
+
+
+def cookbook_tasks() -> list[tuple]:
+    return [json_source_task(convert_cookbooks, "cookbooks.json")]
+
+
+def security_rule_tasks() -> list[tuple]:
+    return [json_source_task(convert_security_rules, "security-rules.json")]
 
-        # Only include if not too large (skip huge files)
-        if len(content) > 20000:
-            # For large files, just include the export section and first few defs
-            lines = content.split("\n")
-            truncated = []
-            for line in lines[:500]:
-                truncated.append(line)
-            content = "\n".join(truncated) + "\n;; ... (truncated)"
 
-        source_id = f"std-source:{mod_path}"
-        q = f"Show me the implementation of {description} in Gerbil's standard library."
-        a = f"Here's the source from `{mod_path}`:\n\n```scheme\n{content.strip()}\n```"
+def error_fix_tasks() -> list[tuple]:
+    return [json_source_task(convert_error_fixes, "error-fixes.json")]
 
-        chatml_entries.append(make_chatml([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": q},
-            {"role": "assistant", "content": a},
-        ], f"{source_id}:full"))
 
-        alpaca_entries.append(make_alpaca(q, a, source_id=f"{source_id}:full"))
+def convention_tasks() -> list[tuple]:
+    return [(generate_convention_entries, (), None)]
 
-    return chatml_entries, alpaca_entries
+
+def run_task(task: tuple) -> tuple[list[Example], dict]:
+    """Run one task. Returns (entries, metrics measured in the running process)."""
+    fn, args, _ = task
+    counters = dict(COUNTERS)
+    with Meter() as meter:
+        result = fn(*args)
+    metrics = {key: COUNTERS[key] - counters[key] for key in COUNTERS}
+    metrics.update(wall_s=meter.wall, cpu_s=meter.cpu, rss_kb=meter.rss_kb)
+    return result, metrics
+
+
+def run_tasks(tasks: list[tuple], jobs: int = 1):
+    """Yield (entries, metrics) for each task, in task order.
+
+    With jobs > 1 the tasks are spread over a process pool; results are
+    still yielded in the order the tasks were given.
+    """
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield run_task(task)
+        return
+
+    # Small chunks keep the pool balanced when a few files dominate
+    chunksize = max(1, len(tasks) // (jobs * 8))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=set_source_dirs,
+                             initargs=(MCP_DIR, GERBIL_DIR, GAMBIT_DIR)) as pool:
+        yield from pool.map(run_task, tasks, chunksize=chunksize)
+
+
+def collect(tasks: list[tuple], jobs: int = 1) -> list[Example]:
+    """Run tasks and concatenate their entries."""
+    entries = []
+    for result, _ in run_tasks(tasks, jobs):
+        entries.extend(result)
+    return entries
+
+
+# ── Source registry ────────────────────────────────────────────────────
+#
+# Each source names the task lister that converts it and the source-ID
+# prefixes of the entries it produces. Listers only run for the sources
+# selected with --only/--skip; the entries of the others are carried over
+# from the existing output by matching their IDs against these prefixes.
+
+class Source(NamedTuple):
+    name: str
+    message: str                        # progress line
+    list_tasks: Callable[[], list[tuple]]
+    prefixes: tuple[str, ...]           # source IDs it owns; the longest match wins
+
+
+# In output order
+SOURCES = [
+    Source("cookbooks", "Converting cookbooks.json ...", cookbook_tasks, ("cookbook:",)),
+    Source("security", "Converting security-rules.json ...", security_rule_tasks, ("security:",)),
+    Source("error-fixes", "Converting error-fixes.json ...", error_fix_tasks, ("errorfix:",)),
+    # Resource doc IDs are relative to GERBIL_DIR or bare file names; every
+    # doc: ID the Gerbil doc sources below don't claim is theirs
+    Source("resources", "Converting gerbil-mcp resource docs ...", resource_md_tasks, ("doc:",)),
+    Source("guide", "Converting Gerbil guide docs ...", guide_doc_tasks, ("doc:doc/guide/",)),
+    Source("reference", "Converting Gerbil reference docs ...", reference_doc_tasks,
+           ("doc:doc/reference/", "api:")),
+    Source("tutorials", "Converting tutorials ...", tutorial_tasks,
+           ("tutorial:", "source:", "doc:doc/tutorials/")),
+    Source("gambit", "Converting Gambit examples ...", gambit_example_tasks, ("gambit:",)),
+    Source("tests", "Converting test files ...", test_file_tasks, ("test:",)),
+    Source("std-source", "Converting std library source ...", std_source_tasks, ("std-source:",)),
+    Source("conventions", "Generating Gerbil convention examples ...", convention_tasks, ("convention:",)),
+]
+
+
+def select_sources(only: Optional[str], skip: Optional[str]) -> list[Source]:
+    """Resolve --only/--skip lists of source names or output categories ("api", "doc").
+
+    Raises ValueError for a name that matches no source.
+    """
+    def matching(names: str) -> set[str]:
+        selected = set()
+        for name in filter(None, (n.strip() for n in names.split(","))):
+            hits = {src.name for src in SOURCES
+                    if name == src.name or any(p.split(":")[0] == name for p in src.prefixes)}
+            if not hits:
+                raise ValueError(f"unknown source {name!r} (see --list-sources)")
+            selected |= hits
+        return selected
+
+    names = matching(only) if only else {src.name for src in SOURCES}
+    if skip:
+        names -= matching(skip)
+    return [src for src in SOURCES if src.name in names]
+
+
+def source_owner(source_id: str) -> Optional[str]:
+    """Name of the registered source that produces an entry ID."""
+    best, best_len = None, -1
+    for src in SOURCES:
+        for prefix in src.prefixes:
+            if source_id.startswith(prefix) and len(prefix) > best_len:
+                best, best_len = src.name, len(prefix)
+    return best
 
 
 # ═══════════════════════════════════════════════════════════════════════
-# Deduplication
+# Build Cache
 # ═══════════════════════════════════════════════════════════════════════
+#
+# Each task's result is stored under a key derived from the converter code,
+# SYSTEM_PROMPT, the source directories, the task itself, and the content of
+# its input file. A rerun converts only tasks whose key changed and splices
+# the cached entries back in for everything else. Input hashes are memoized
+# by size and mtime, so unchanged inputs are not even read on a rerun.
+
+def converter_fingerprint() -> str:
+    """Hash everything besides the input file that can change a task's output."""
+    h = hashlib.sha256()
+    h.update(Path(__file__).read_bytes())
+    for part in (SYSTEM_PROMPT, MCP_DIR, GERBIL_DIR, GAMBIT_DIR):
+        h.update(b"\0" + part.encode())
+    return h.hexdigest()
+
+
+def file_digest(path: str, memo: Optional[dict] = None) -> str:
+    """Content hash of a file, or a marker when it can't be read.
+
+    memo maps path → [size, mtime_ns, digest] from earlier runs; a file whose
+    size and mtime still match is not read again.
+    """
+    info = file_index().stat(path)
+    try:
+        if info is None:
+            st = os.stat(path)
+            info = FileInfo(path, st.st_size, st.st_mtime_ns, "")
+        if memo is not None:
+            hit = memo.get(path)
+            if hit and hit[:2] == [info.size, info.mtime_ns]:
+                return hit[2]
+        if info.size > STREAM_FILE_BYTES:
+            h = hashlib.sha256()
+            for chunk in read_chunks(path):
+                h.update(chunk)
+            digest = h.hexdigest()
+        else:
+            digest = hashlib.sha256(read_bytes(path)).hexdigest()
+    except OSError as e:
+        return f"unreadable:{type(e).__name__}"
+    if memo is not None:
+        memo[path] = [info.size, info.mtime_ns, digest]
+    return digest
+
+
+def load_digest_memo(cache_dir: str) -> dict:
+    try:
+        with open(os.path.join(cache_dir, "digests.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_digest_memo(cache_dir: str, memo: dict):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, "digests.json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(memo, f)
+    os.replace(tmp, path)
+
+
+def cache_key(task: tuple, fingerprint: str, memo: Optional[dict] = None) -> str:
+    fn, args, path = task
+    # Functions passed as arguments are identified by name, not address
+    arg_repr = repr(tuple(a.__name__ if callable(a) else a for a in args))
+    h = hashlib.sha256()
+    h.update(f"{fingerprint}\0{fn.__name__}\0{arg_repr}\0".encode())
+    if path is not None:
+        h.update(file_digest(path, memo).encode())
+    return h.hexdigest()
+
+
+def cache_load(cache_dir: str, key: str) -> Optional[list[Example]]:
+    try:
+        with open(os.path.join(cache_dir, key[:2], f"{key}.json")) as f:
+            return [Example(*fields) for fields in json.load(f)]
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def cache_store(cache_dir: str, key: str, result: list[Example]):
+    """Write a cache entry atomically, so an interrupted run can't corrupt it."""
+    bucket = os.path.join(cache_dir, key[:2])
+    os.makedirs(bucket, exist_ok=True)
+    path = os.path.join(bucket, f"{key}.json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def cache_prune(cache_dir: str, keep: set[str]) -> int:
+    """Delete cache entries not used by this run. Returns the number removed."""
+    removed = 0
+    for path in glob.glob(os.path.join(cache_dir, "*", "*.json")):
+        if os.path.basename(path)[:-len(".json")] not in keep:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def run_cached(tasks: list[tuple], jobs: int, cache_dir: Optional[str], prune: bool = True):
+    """Like run_tasks, but serve unchanged tasks from the build cache.
+
+    Only cache misses are sent to the pool; their results are stored as they
+    arrive. Returns ((entries, metrics) iterator, stats dict), where metrics
+    is None for a cache hit; the stats are filled in as the iterator is
+    consumed. prune=False keeps the entries this run did
+    not use, for runs that convert only some of the sources.
+    """
+    stats = {"hits": 0, "misses": 0, "pruned": 0}
+    if cache_dir is None:
+        return run_tasks(tasks, jobs), stats
+
+    fingerprint = converter_fingerprint()
+    memo = load_digest_memo(cache_dir)
+    keys = [cache_key(task, fingerprint, memo) for task in tasks]
+    if prune:
+        # Keep only the files this run looked at
+        inputs = {path for _, _, path in tasks if path is not None}
+        memo = {path: memo[path] for path in inputs if path in memo}
+    save_digest_memo(cache_dir, memo)
+    cached = [cache_load(cache_dir, key) for key in keys]
+    misses = run_tasks([t for t, hit in zip(tasks, cached) if hit is None], jobs)
+
+    def results():
+        for key, hit in zip(keys, cached):
+            if hit is not None:
+                stats["hits"] += 1
+                yield hit, None
+            else:
+                stats["misses"] += 1
+                result, metrics = next(misses)
+                cache_store(cache_dir, key, result)
+                yield result, metrics
+        if prune:
+            stats["pruned"] = cache_prune(cache_dir, set(keys))
+
+    return results(), stats
+
+
+# ═══════════════════════════════════════════════════════════════════════
+# Pipeline: source entries → chunking → dedup → fan-out writer
+# ═══════════════════════════════════════════════════════════════════════
+#
+# Entries flow through the stages one Example at a time, so nothing holds
+# the whole corpus in memory.
+
+def source_metrics(totals: dict, task_metrics: Optional[dict]):
+    """Add one task's metrics (None for a cache hit) to its source's totals."""
+    if task_metrics is None:
+        totals["cached"] += 1
+        return
+    totals["converted"] += 1
+    for key, value in task_metrics.items():
+        if key == "rss_kb":
+            totals[key] = max(totals[key], value)  # tasks may run in different processes
+        else:
+            totals[key] += value
+
+
+def iter_source_entries(plan: list[tuple], results, kept: Optional[dict] = None,
+                        metrics: Optional[dict] = None):
+    """Yield examples from task results, reporting each source.
+
+    plan holds (Source, tasks) pairs; tasks is None for a source that isn't
+    being regenerated, whose entries come from kept[name] instead. If given,
+    metrics is filled with per-source totals, keyed by source name.
+    """
+    for source, tasks in plan:
+        count = 0
+        totals = {"tasks": 0, "cached": 0, "converted": 0, "kept": tasks is None, "entries": 0,
+                  "wait_s": 0.0, "wall_s": 0.0, "cpu_s": 0.0, "read_s": 0.0, "read_bytes": 0,
+                  "gerbilize_s": 0.0, "rss_kb": 0}
+        if tasks is None:
+            print(f"Keeping existing {source.name} entries ...")
+            for ex in kept.get(source.name, []):
+                count += 1
+                yield ex
+        else:
+            print(source.message)
+            waiting = Meter()
+            for _ in tasks:
+                with waiting:  # time the main process spends on the cache or the pool
+                    result, task_metrics = next(results)
+                source_metrics(totals, task_metrics)
+                for ex in result:
+                    count += 1
+                    yield ex
+            totals["tasks"], totals["wait_s"] = len(tasks), waiting.wall
+        print(f"  → {count} entries")
+        if metrics is not None:
+            totals["entries"] = count
+            metrics[source.name] = totals
+    if kept and kept.get(None):
+        print("Keeping existing entries of no known source ...")
+        yield from kept[None]
+        print(f"  → {len(kept[None])} entries")
+    # Drain the iterator so the cache gets pruned
+    next(results, None)
+
+
+# ── Chunking: long entries → token-budgeted parts ─────────────────────
+#
+# Converters emit whole documents and source files; entries whose answer is
+# over the token budget are split here so nothing is truncated by the
+# training window. Markdown is cut at headings and code fences, and an
+# oversized Scheme block at top-level form boundaries, re-fenced per part.
+# Each part keeps the question with a "(part i of n)" label.
+
+CHUNK_TOKENS = 3072     # answer budget; leaves room for prompt and template in MAX_SEQ_LENGTH
+CHARS_PER_TOKEN = 3     # Qwen averages a little more on code and prose; errs long
+
+_PAREN = re.compile(r'[()\[\]\n]')
+_MD_HEADING = re.compile(r'#{1,6}\s')
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-leaning token estimate, no tokenizer needed."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def scheme_form_units(code: str) -> list[str]:
+    """Split Scheme source into top-level forms.
+
+    Leading comments stay with the form they describe; blank lines stay
+    with the form before them.
+    """
+    # Offsets of lines that start outside any form, string or block comment
+    starts = [0]
+    depth = 0
+    pos = 0
+    for i, piece in enumerate(_SCHEME_SKIP.split(code)):
+        if i % 2 == 0:
+            for m in _PAREN.finditer(piece):
+                c = m.group()
+                if c == "\n":
+                    if depth == 0:
+                        starts.append(pos + m.end())
+                elif c in "([":
+                    depth += 1
+                else:
+                    depth = max(0, depth - 1)
+        pos += len(piece)
+
+    units = []
+    unit_start = 0
+    prev_comment = False
+    for start, end in zip(starts, starts[1:] + [len(code)]):
+        line = code[start:end].strip()
+        if line and start > unit_start and not prev_comment:
+            units.append(code[unit_start:start])
+            unit_start = start
+        if line:
+            prev_comment = line.startswith(";")
+    units.append(code[unit_start:])
+    return [u for u in units if u]
+
+
+def markdown_units(text: str) -> list[tuple[str, Optional[tuple[str, str, str]]]]:
+    """Split markdown into blocks at headings and around fenced code.
+
+    Returns (block, fence) pairs; fence is (opening line, lang, closing line)
+    for code blocks and None for prose.
+    """
+    units = []
+    current = []
+    fence = None
+    for line in text.splitlines(keepends=True):
+        stripped = line.lstrip(" ")
+        if fence is None:
+            m = re.match(r'(`{3,}|~{3,})(.*)', stripped) if len(line) - len(stripped) <= 3 else None
+            if m and not (m.group(1)[0] == "`" and "`" in m.group(2)):
+                if current:
+                    units.append(("".join(current), None))
+                info = m.group(2).split()
+                fence = (m.group(1), info[0].lower() if info else "")
+                current = [line]
+            elif _MD_HEADING.match(line) and current:
+                units.append(("".join(current), None))
+                current = [line]
+            else:
+                current.append(line)
+        else:
+            current.append(line)
+            marker = stripped.rstrip()
+            if marker.startswith(fence[0]) and not marker.strip(fence[0][0]):
+                units.append(("".join(current), (current[0], fence[1], line)))
+                current = []
+                fence = None
+    if current:
+        # An unclosed fence is treated as prose rather than guessing its end
+        units.append(("".join(current), None))
+    return units
+
+
+def _split_lines(text: str, budget: int) -> list[str]:
+    """Last resort: split at line breaks (a single huge line stays whole)."""
+    parts, current = [], ""
+    for line in text.splitlines(keepends=True):
+        if current and estimate_tokens(current + line) > budget:
+            parts.append(current)
+            current = ""
+        current += line
+    return parts + [current] if current else parts
+
+
+def _pack(units: list[str], budget: int) -> list[str]:
+    """Greedily join consecutive units into parts that fit the budget."""
+    parts, current = [], ""
+    for unit in units:
+        if current and estimate_tokens(current + unit) > budget:
+            parts.append(current)
+            current = ""
+        current += unit
+    return parts + [current] if current else parts
+
+
+def chunk_text(text: str, budget: int) -> list[str]:
+    """Split a markdown answer into parts of at most ~budget tokens."""
+    if estimate_tokens(text) <= budget:
+        return [text]
+    units = []
+    for block, fence in markdown_units(text):
+        if estimate_tokens(block) <= budget:
+            units.append(block)
+        elif fence is None:
+            # Paragraphs, then lines
+            for para in re.split(r'(?<=\n\n)', block):
+                units.extend([para] if estimate_tokens(para) <= budget else _split_lines(para, budget))
+        else:
+            # Re-fence each slice of an oversized code block
+            opening, lang, closing = fence
+            code = block[len(opening):len(block) - len(closing)]
+            if not closing.endswith("\n"):
+                closing += "\n"
+            inner = budget - estimate_tokens(opening + closing)
+            pieces = scheme_form_units(code) if lang in SCHEME_FENCE_LANGS else code.splitlines(keepends=True)
+            pieces = [q for p in pieces for q in ([p] if estimate_tokens(p) <= inner else _split_lines(p, inner))]
+            units.extend(opening + part + closing for part in _pack(pieces, inner))
+    return [part.strip("\n") for part in _pack(units, budget)]
+
+
+def chunk_examples(examples, budget: int, stats: dict):
+    """Split examples whose answer is over budget into labelled parts.
+
+    Counts split examples and the parts they became in stats["chunked"] /
+    stats["parts"].
+    """
+    for ex in examples:
+        parts = chunk_text(ex.answer, budget)
+        if len(parts) == 1:
+            yield ex
+            continue
+        stats["chunked"] += 1
+        stats["parts"] += len(parts)
+        n = len(parts)
+        for i, part in enumerate(parts, 1):
+            yield ex._replace(source=f"{ex.source}:part{i}",
+                              question=f"{ex.question} (part {i} of {n})",
+                              answer=part)
+
 
-def deduplicate(entries: list[dict], key_field: str = "source") -> list[dict]:
-    """Remove duplicate entries by source ID."""
+def deduplicate(examples, stats: dict):
+    """Drop examples that repeat an earlier source ID.
+
+    Counts examples seen and kept in stats["before"] / stats["after"].
+    """
     seen = set()
-    deduped = []
-    for entry in entries:
-        sid = entry.get(key_field, "")
-        if sid and sid not in seen:
-            seen.add(sid)
-            deduped.append(entry)
-        elif not sid:
+    for ex in examples:
+        stats["before"] += 1
+        sid = ex.source
+        if not sid:
             # No source ID, use content hash
-            content_hash = hashlib.md5(json.dumps(entry, sort_keys=True).encode()).hexdigest()
-            if content_hash not in seen:
-                seen.add(content_hash)
-                deduped.append(entry)
-    return deduped
+            sid = hashlib.md5(json.dumps(ex, sort_keys=True).encode()).hexdigest()
+        if sid in seen:
+            continue
+        seen.add(sid)
+        stats["after"] += 1
+        yield ex
+
+
+# ── Near-duplicate removal (MinHash + LSH) ─────────────────────────────
+#
+# Source-ID dedup only catches exact repeats. This stage catches examples
+# whose question+answer text is nearly identical (cookbook :howto/:example
+# variants, doc sections that reappear as API entries, tests that copy
+# tutorial code). Signatures use one-permutation MinHash: each shingle is
+# hashed once and binned, so cost is linear in the text size. LSH banding
+# finds candidates without comparing every pair. The parts of a chunked
+# document are compared and kept or dropped together, so no document loses
+# a middle part under its "(part i of n)" labels.
+
+NUM_PERM = 128                  # signature bins (power of two)
+SHINGLE_WORDS = 5               # words per shingle
+NEAR_DUP_THRESHOLD = 0.85       # estimated Jaccard similarity to collapse
+NEAR_DUP_EXEMPT = ("convention",)  # hand-written teaching examples, always kept
+MAX_BUCKET = 64                 # bound candidate lists for boilerplate-heavy bands
+
+_BIN_SHIFT = 64 - (NUM_PERM.bit_length() - 1)
+_VALUE_MASK = (1 << _BIN_SHIFT) - 1
+_EMPTY = _VALUE_MASK + 1
+_MIX = 0x9E3779B97F4A7C15       # 64-bit golden-ratio multiplier
+
+
+def minhash_signature(text: str) -> Optional[array]:
+    """One-permutation MinHash signature of a text's word shingles.
+
+    Returns None for texts with no words.
+    """
+    words = text.lower().split()
+    if not words:
+        return None
+    n = max(1, len(words) - SHINGLE_WORDS + 1)
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(n)}
+
+    sig = [_EMPTY] * NUM_PERM
+    for shingle in shingles:
+        h = (zlib.crc32(shingle.encode()) * _MIX) & 0xFFFFFFFFFFFFFFFF
+        b = h >> _BIN_SHIFT
+        v = h & _VALUE_MASK
+        if v < sig[b]:
+            sig[b] = v
+
+    # Densify: an empty bin borrows the next filled bin (circularly), tagged
+    # with the distance so borrowed values don't collide with real ones
+    if _EMPTY in sig:
+        dense = sig[:]
+        nearest = None
+        for i in range(2 * NUM_PERM - 1, -1, -1):
+            k = i % NUM_PERM
+            if sig[k] != _EMPTY:
+                nearest = i
+            elif i < NUM_PERM:
+                dense[k] = ((nearest - i) << _BIN_SHIFT) | sig[nearest % NUM_PERM]
+        sig = dense
+
+    return array("Q", sig)
+
+
+def lsh_rows(threshold: float) -> int:
+    """Rows per LSH band: the fewest bands whose S-curve sits below threshold.
+
+    A pair with similarity s becomes a candidate with probability
+    1 - (1 - s^r)^b, which rises steeply around (1/b)^(1/r). Keeping that
+    point 0.1 under the threshold gives high recall before verification.
+    """
+    rows = 1
+    for r in (2, 4, 8, 16, 32):
+        if (r / NUM_PERM) ** (1 / r) <= threshold - 0.1:
+            rows = r
+    return rows
+
+
+def document_id(source_id: str) -> str:
+    """Source ID of the document an entry belongs to: without chunk_examples' :partN."""
+    return re.sub(r':part\d+$', '', source_id)
+
+
+def near_deduplicate(examples, threshold: float, clusters: dict, stats: dict):
+    """Drop documents that are near-duplicates of an earlier kept document.
+
+    A document is one example or the consecutive parts of a chunked one. The
+    first document of each cluster is kept. Dropped examples are recorded as
+    clusters[kept_document] = [(dropped_source, similarity), ...] and counted
+    in stats["near_dups"].
+    """
+    rows = lsh_rows(threshold)
+    bands = NUM_PERM // rows
+    buckets = {}
+    kept = []  # (document ID, signature) of every kept document
+
+    for doc, parts in groupby(examples, key=lambda ex: document_id(ex.source)):
+        parts = list(parts)
+        if doc.split(":")[0] in NEAR_DUP_EXEMPT:
+            yield from parts
+            continue
+        sig = minhash_signature("\n".join(f"{ex.question}\n{ex.answer}" for ex in parts))
+        if sig is None:
+            yield from parts
+            continue
+
+        keys = [hash((b, sig[b * rows:(b + 1) * rows].tobytes())) for b in range(bands)]
+        candidates = sorted({i for key in keys for i in buckets.get(key, ())})
+
+        # Verify candidates; the most similar (earliest on ties) wins
+        best, best_sim = None, 0.0
+        for i in candidates:
+            sim = sum(x == y for x, y in zip(sig, kept[i][1])) / NUM_PERM
+            if sim >= threshold and sim > best_sim:
+                best, best_sim = i, sim
+
+        if best is not None:
+            clusters.setdefault(kept[best][0], []).extend((ex.source, best_sim) for ex in parts)
+            stats["near_dups"] += len(parts)
+            continue
+
+        kept.append((doc, sig))
+        for key in keys:
+            bucket = buckets.setdefault(key, [])
+            if len(bucket) < MAX_BUCKET:
+                bucket.append(len(kept) - 1)
+        yield from parts
+
+
+def write_near_dup_report(path: str, clusters: dict, threshold: float):
+    """Write collapsed clusters, largest first, as JSON."""
+    report = {
+        "threshold": threshold,
+        "removed": sum(len(dropped) for dropped in clusters.values()),
+        "clusters": [
+            {
+                "kept": kept,
+                "dropped": [{"source": sid, "similarity": round(sim, 3)} for sid, sim in dropped],
+            }
+            for kept, dropped in sorted(clusters.items(), key=lambda x: -len(x[1]))
+        ],
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def load_near_dup_clusters(path: str, regenerated: set[str]) -> dict:
+    """Read back an earlier report's drops of entries from sources not in regenerated.
+
+    Those entries stay out of the output of a partial run, like the kept
+    entries stay in, so their clusters carry over. Returns clusters shaped
+    like near_deduplicate's.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        report = json.load(f)
+    clusters = {}
+    for cluster in report["clusters"]:
+        dropped = [(d["source"], d["similarity"]) for d in cluster["dropped"]
+                   if source_owner(d["source"]) not in regenerated]
+        if dropped:
+            clusters[cluster["kept"]] = dropped
+    return clusters
+
+
+# ── Output shards and manifest ─────────────────────────────────────────
+
+def parse_shard_size(value: str) -> tuple[Optional[int], Optional[int]]:
+    """Parse --shard-size: "5000" → 5000 entries, "4MB" → 4 MiB. Returns (entries, bytes)."""
+    m = re.fullmatch(r'\s*(\d+)\s*([KMG])?(i?B)?\s*', value, re.IGNORECASE)
+    if not m or int(m.group(1)) == 0 or (m.group(3) and not m.group(2) and m.group(3).lower() != "b"):
+        raise argparse.ArgumentTypeError(f"expected an entry count or a size like 4MB, got {value!r}")
+    n = int(m.group(1))
+    if not m.group(2) and not m.group(3):
+        return n, None
+    return None, n << {"": 0, "K": 10, "M": 20, "G": 30}[(m.group(2) or "").upper()]
+
+
+class _HashingFile:
+    """Write-only file wrapper that hashes and counts the bytes on disk.
+
+    Writes go to path.tmp; the owner renames it into place once the whole
+    output is complete.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp = f"{path}.tmp"
+        self.f = open(self.tmp, "wb")
+        self.hash = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self.f.write(data)
+        self.hash.update(data)
+        self.bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class ShardedWriter:
+    """Write one output format, rolling over to a new shard at the size limit.
+
+    Without a limit the format goes to `path` as before; with one, shards are
+    named path-00000.ext, path-00001.ext, ... Each shard is hashed as it is
+    written and described by a manifest record in `shards`. With array=True
+    every shard is a JSON array laid out like json.dump(..., indent=2).
+
+    Given make_compressor (a factory, since a zstandard compressor can only
+    drive one stream at a time), every shard is its own .zst file. Limits
+    and entry offsets always count uncompressed bytes; the manifest records
+    both sizes.
+
+    Shards are written as .tmp files: close() finishes them, commit() renames
+    them all into place and abort() throws them away, so readers only ever
+    see complete files from one run.
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None, array: bool = False, make_compressor=None):
+        self.path = path + ".zst" if make_compressor else path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.array = array
+        self.make_compressor = make_compressor
+        self.sharded = bool(max_entries or max_bytes)
+        self.shards = []
+        self.f = None
+        self._base = path  # uncompressed name, for stale-file cleanup
+        self._finished = []  # closed _HashingFiles waiting for commit()
+
+    def _shard_path(self, index: int) -> str:
+        if not self.sharded:
+            return self.path
+        stem, ext = os.path.splitext(self._base)
+        return f"{stem}-{index:05d}{ext}" + (".zst" if self.make_compressor else "")
+
+    def _open(self):
+        path = self._shard_path(len(self.shards))
+        self.sink = _HashingFile(path)
+        if self.make_compressor:
+            self.f = self.make_compressor().stream_writer(self.sink, closefd=False)
+        else:
+            self.f = self.sink
+        self.raw_bytes = 0
+        self.current = {"file": os.path.basename(path), "entries": 0, "bytes": 0, "categories": {}}
+
+    def _emit(self, data: bytes):
+        self.f.write(data)
+        self.raw_bytes += len(data)
+
+    def _finish(self):
+        if self.array:
+            self._emit(b"\n]" if self.current["entries"] else b"[]")
+        if self.make_compressor:
+            self.f.close()  # ends the zstd frame
+            self.current["raw_bytes"] = self.raw_bytes
+        self.sink.close()
+        self._finished.append(self.sink)
+        self.f = None
+        self.current["bytes"] = self.sink.bytes
+        self.current["sha256"] = self.sink.hash.hexdigest()
+        self.shards.append(self.current)
+
+    def encode(self, entry: dict) -> bytes:
+        if self.array:
+            # Strings never contain raw newlines, so re-indenting by line is safe
+            return ("  " + json.dumps(entry, ensure_ascii=False, indent=2).replace("\n", "\n  ")).encode()
+        return (json.dumps(entry, ensure_ascii=False) + "\n").encode()
+
+    def write(self, entry: dict, category: str) -> tuple[str, int]:
+        """Write one entry. Returns (shard file name, uncompressed byte offset of the entry)."""
+        data = self.encode(entry)
+        if self.f is not None and self.current["entries"] and (
+                (self.max_entries and self.current["entries"] >= self.max_entries)
+                or (self.max_bytes and self.raw_bytes + len(data) > self.max_bytes)):
+            self._finish()
+        if self.f is None:
+            self._open()
+        if self.array:
+            self._emit(b",\n" if self.current["entries"] else b"[\n")
+
+        offset = self.raw_bytes
+        self._emit(data)
+        self.current["entries"] += 1
+        self.current["categories"][category] = self.current["categories"].get(category, 0) + 1
+        return self.current["file"], offset
+
+    def close(self):
+        if self.f is None and not self.shards:
+            self._open()  # an empty corpus still gets a (valid, empty) file
+        if self.f is not None:
+            self._finish()
+
+    def commit(self):
+        """Move the finished shards into place and delete leftovers of earlier runs."""
+        for sink in self._finished:
+            os.replace(sink.tmp, sink.path)
+        self._finished = []
+        self._remove_stale()
+
+    def abort(self):
+        """Discard everything written by this writer; the previous output stays."""
+        if self.f is not None:
+            self.sink.close()
+            self._finished.append(self.sink)
+            self.f = None
+        for sink in self._finished:
+            if os.path.exists(sink.tmp):
+                os.remove(sink.tmp)
+        self._finished = []
+
+    def _remove_stale(self):
+        """Delete files left by an earlier run with a different layout or compression."""
+        written = {shard["file"] for shard in self.shards}
+        stem, ext = os.path.splitext(self._base)
+        shard_glob = f"{glob.escape(stem)}-[0-9][0-9][0-9][0-9][0-9]{ext}"
+        for path in glob.glob(shard_glob) + glob.glob(shard_glob + ".zst") + [self._base, self._base + ".zst"]:
+            if os.path.basename(path) not in written and os.path.exists(path):
+                os.remove(path)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(shard["bytes"] for shard in self.shards)
+
+
+def write_manifest(path: str, writers: dict, source_counts: dict, zstd_info: Optional[dict] = None):
+    """Describe every output shard: entry counts, sizes, hashes, categories."""
+    any_writer = next(iter(writers.values()))
+    manifest = {
+        "shard_limit": {"entries": any_writer.max_entries, "bytes": any_writer.max_bytes},
+        "zstd": zstd_info,
+        "entries": sum(source_counts.values()),
+        "categories": dict(sorted(source_counts.items())),
+        "formats": {
+            name: {
+                "entries": sum(shard["entries"] for shard in writer.shards),
+                "bytes": writer.total_bytes,
+                "shards": writer.shards,
+            }
+            for name, writer in writers.items()
+        },
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+# ── Zstandard output ───────────────────────────────────────────────────
+#
+# Every JSONL line repeats SYSTEM_PROMPT and most answers share boilerplate,
+# so the files compress very well. One long stream finds those repeats on
+# its own; small shards are independent frames, so they share a dictionary
+# trained on the first entries instead.
+
+ZSTD_LEVEL = 19
+ZSTD_DICT_SIZE = 112 * 1024        # zstd's default dictionary size
+ZSTD_DICT_SAMPLES = 2000           # leading entries sampled per format
+ZSTD_DICT_FILE = "training_data.zdict"
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        print("Install zstandard for --zstd: pip install zstandard")
+        sys.exit(1)
+    return zstandard
+
+
+def train_zstd_dictionary(zstandard, samples: list[bytes]):
+    """Train a shared dictionary, or None when there is too little data."""
+    try:
+        return zstandard.train_dictionary(ZSTD_DICT_SIZE, samples)
+    except zstandard.ZstdError:
+        return None
+
+
+# ── Token index ────────────────────────────────────────────────────────
+#
+# Counts tokens the way train_unsloth.py sees them: the ChatML conversation
+# rendered through the Qwen chat template. That shows how much of the corpus
+# would be cut off by the training window before paying for a run.
+
+TOKENIZER_NAME = "Qwen/Qwen2.5-Coder-7B-Instruct"  # same tokenizer as the 4-bit training model
+MAX_SEQ_LENGTH = 4096                              # train_unsloth.py window
+TOKEN_BATCH = 256                                  # entries per tokenizer call
+TOKEN_BUCKETS = [256, 512, 1024, 2048, 4096, 8192]
+
+
+def load_tokenizer(name: str):
+    """Load a tokenizer from the local Hugging Face cache (never downloads)."""
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        print("Install transformers for --token-index/--pretokenize: pip install transformers")
+        sys.exit(1)
+    try:
+        return AutoTokenizer.from_pretrained(name, local_files_only=True)
+    except OSError:
+        print(f"Tokenizer {name} is not cached locally. Fetch it once with:")
+        print(f"  huggingface-cli download {name} tokenizer.json tokenizer_config.json vocab.json merges.txt")
+        sys.exit(1)
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Identify a tokenizer by its vocabulary and chat template.
+
+    train_unsloth.py computes the same hash to decide whether the
+    pre-tokenized corpus was built for the tokenizer it loaded.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False).encode())
+    h.update(b"\0" + str(tokenizer.chat_template or "").encode())
+    return h.hexdigest()
+
+
+class TokenIndex:
+    """Batch-tokenize entries into a sidecar index and per-category histogram.
+
+    Each index line is {"source", "tokens", "file", "offset"}, where offset
+    is the byte position of the entry in the (decompressed) ChatML file or
+    shard `file`.
+
+    With pretokenized_dir the token ids are kept too, as raw arrays that
+    train_unsloth.py memory-maps: tokens.u32 (all entries back to back),
+    offsets.i64 (entry i is tokens[offsets[i]:offsets[i+1]]) and mask.u8
+    (1 on the assistant reply), described by meta.json.
+    """
+
+    def __init__(self, tokenizer, path: str, max_seq_length: int, pretokenized_dir: Optional[str] = None):
+        self.tokenizer = tokenizer
+        self.path = path
+        self.max_seq_length = max_seq_length
+        self.f = open(f"{path}.tmp", "w")
+        self.pending = []      # (source, file, offset, text, reply start) waiting for a batch
+        self.histogram = {}    # category → entry count per TOKEN_BUCKETS bucket
+        self.totals = {}       # category → total tokens
+        self.entry_tokens = array("I")  # per entry, in output order
+        self.over_budget = []  # (tokens, source)
+        self.meter = Meter()   # time spent templating and tokenizing
+
+        self.pretokenized_dir = pretokenized_dir
+        if pretokenized_dir:
+            os.makedirs(pretokenized_dir, exist_ok=True)
+            meta = os.path.join(pretokenized_dir, "meta.json")
+            if os.path.exists(meta):
+                os.remove(meta)  # a corpus without meta.json is never loaded
+            self.token_f = open(os.path.join(pretokenized_dir, "tokens.u32"), "wb")
+            self.mask_f = open(os.path.join(pretokenized_dir, "mask.u8"), "wb")
+            self.offsets = array("q", [0])
+
+    def add(self, source: str, file: str, offset: int, messages: list[dict]):
+        text = self.tokenizer.apply_chat_template(messages, tokenize=False)
+        reply_start = 0
+        if self.pretokenized_dir:
+            # Everything up to the assistant header is prompt; when the template
+            # doesn't render as prefix + reply, train on the whole entry instead
+            prompt = self.tokenizer.apply_chat_template(messages[:-1], tokenize=False,
+                                                        add_generation_prompt=True)
+            if text.startswith(prompt):
+                reply_start = len(prompt)
+        self.pending.append((source, file, offset, text, reply_start))
+        if len(self.pending) >= TOKEN_BATCH:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch = self.tokenizer([text for _, _, _, text, _ in self.pending],
+                               add_special_tokens=False, return_attention_mask=False,
+                               return_offsets_mapping=bool(self.pretokenized_dir))
+        for i, ((source, file, offset, _, reply_start), ids) in enumerate(zip(self.pending, batch["input_ids"])):
+            tokens = len(ids)
+            self.entry_tokens.append(tokens)
+            if self.pretokenized_dir:
+                array("I", ids).tofile(self.token_f)
+                self.mask_f.write(bytes(start >= reply_start for start, _ in batch["offset_mapping"][i]))
+                self.offsets.append(self.offsets[-1] + tokens)
+            self.f.write(json.dumps({"source": source, "tokens": tokens, "file": file, "offset": offset},
+                                    ensure_ascii=False) + "\n")
+            category = source.split(":")[0]
+            bins = self.histogram.setdefault(category, [0] * (len(TOKEN_BUCKETS) + 1))
+            bins[bisect_left(TOKEN_BUCKETS, tokens)] += 1
+            self.totals[category] = self.totals.get(category, 0) + tokens
+            if tokens > self.max_seq_length:
+                self.over_budget.append((tokens, source))
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.f.close()
+        os.replace(f"{self.path}.tmp", self.path)
+        if self.pretokenized_dir:
+            self.token_f.close()
+            self.mask_f.close()
+            with open(os.path.join(self.pretokenized_dir, "offsets.i64"), "wb") as f:
+                self.offsets.tofile(f)
+            meta = {
+                "tokenizer": self.tokenizer.name_or_path,
+                "fingerprint": tokenizer_fingerprint(self.tokenizer),
+                "entries": len(self.offsets) - 1,
+                "tokens": self.offsets[-1],
+                "byteorder": sys.byteorder,
+                "files": {"tokens": "tokens.u32", "offsets": "offsets.i64", "mask": "mask.u8"},
+            }
+            # Written last: its presence marks a complete corpus
+            with open(os.path.join(self.pretokenized_dir, "meta.json"), "w") as f:
+                json.dump(meta, f, indent=2)
+
+    def abort(self):
+        """Drop the unfinished index; the corpus stays unusable until meta.json is written."""
+        self.f.close()
+        os.remove(f"{self.path}.tmp")
+        if self.pretokenized_dir:
+            self.token_f.close()
+            self.mask_f.close()
+
+    def report(self, top: int = 10):
+        """Print the length histogram and the entries over the token budget."""
+        labels = [f"≤{b}" for b in TOKEN_BUCKETS] + [f">{TOKEN_BUCKETS[-1]}"]
+        print(f"\n── Token counts by source category ({self.tokenizer.name_or_path}) ──")
+        print(f"  {'category':<12}{'tokens':>11}" + "".join(f"{label:>8}" for label in labels))
+        for cat, total in sorted(self.totals.items(), key=lambda x: -x[1]):
+            print(f"  {cat:<12}{total:>11,}" + "".join(f"{n:>8}" for n in self.histogram[cat]))
+        print(f"  {'total':<12}{sum(self.totals.values()):>11,}")
+
+        if not self.over_budget:
+            print(f"\nAll entries fit in {self.max_seq_length} tokens")
+            return
+        print(f"\n{len(self.over_budget)} entries exceed {self.max_seq_length} tokens "
+              f"and will be truncated in training:")
+        for tokens, source in sorted(self.over_budget, reverse=True)[:top]:
+            print(f"  {tokens:>7,}  {source}")
+        if len(self.over_budget) > top:
+            print(f"  ... see {self.path}")
+
+
+def write_outputs(examples, output_dir: str, token_index: Optional[TokenIndex] = None,
+                  max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                  zstd: bool = False, mix: Optional["TrainingMix"] = None) -> tuple[dict, dict, Optional[dict]]:
+    """Render and write every output format in a single pass over the examples.
+
+    With zstd=True the JSONL formats are written as .jsonl.zst; the Alpaca
+    JSON array stays plain for the tools that want a single JSON file.
+
+    Nothing replaces the previous output until every format is complete; if
+    the pass fails, the old files are left as they were.
+
+    Returns ({format: ShardedWriter}, {source category: count}, zstd info).
+    """
+    make_compressor = zstd_info = None
+    dict_path = os.path.join(output_dir, ZSTD_DICT_FILE)
+    if zstd:
+        zstandard = import_zstandard()
+        dictionary = None
+        if max_entries or max_bytes:
+            # Peek at the leading entries to train the dictionary, then put them back
+            examples = iter(examples)
+            head = list(islice(examples, ZSTD_DICT_SAMPLES))
+            examples = chain(head, examples)
+            samples = [(json.dumps(render(ex), ensure_ascii=False) + "\n").encode()
+                       for ex in head for render in (to_chatml, to_together, to_alpaca)]
+            dictionary = train_zstd_dictionary(zstandard, samples)
+        if dictionary is not None:
+            with open(f"{dict_path}.tmp", "wb") as f:
+                f.write(dictionary.as_bytes())
+        def make_compressor():
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary, threads=-1)
+        zstd_info = {"level": ZSTD_LEVEL, "dictionary": ZSTD_DICT_FILE if dictionary else None}
+    new_dictionary = (zstd_info or {}).get("dictionary") is not None
+
+    writers = {
+        # ChatML/ShareGPT format (for Axolotl, LLaMA-Factory)
+        "chatml": ShardedWriter(os.path.join(output_dir, "training_data.jsonl"), max_entries, max_bytes,
+                                make_compressor=make_compressor),
+        # Together AI format
+        "together": ShardedWriter(os.path.join(output_dir, "training_data_together.jsonl"), max_entries, max_bytes,
+                                  make_compressor=make_compressor),
+        # Alpaca format, as JSONL and as a combined JSON array (some tools prefer this)
+        "alpaca": ShardedWriter(os.path.join(output_dir, "training_data_alpaca.jsonl"), max_entries, max_bytes,
+                                make_compressor=make_compressor),
+        "alpaca_json": ShardedWriter(os.path.join(output_dir, "training_data_alpaca.json"), max_entries, max_bytes,
+                                     array=True),
+    }
+    source_counts = {}
+
+    try:
+        for ex in examples:
+            category = (ex.source or "unknown").split(":")[0]
+            source_counts[category] = source_counts.get(category, 0) + 1
+
+            chatml = to_chatml(ex)
+            if mix is not None:
+                mix.add(category, chatml["conversations"])
+            shard, offset = writers["chatml"].write(chatml, category)
+            if token_index is not None:
+                with token_index.meter:
+                    token_index.add(ex.source, shard, offset, chatml["conversations"])
+            writers["together"].write(to_together(ex), category)
+            alpaca = to_alpaca(ex)
+            writers["alpaca"].write(alpaca, category)
+            writers["alpaca_json"].write(alpaca, category)
+
+        for writer in writers.values():
+            writer.close()
+        if token_index is not None:
+            with token_index.meter:
+                token_index.close()
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        if token_index is not None:
+            token_index.abort()
+        if new_dictionary:
+            os.remove(f"{dict_path}.tmp")
+        raise
+
+    # Every format is complete: swap the new files in
+    if new_dictionary:
+        os.replace(f"{dict_path}.tmp", dict_path)
+    elif os.path.exists(dict_path):
+        os.remove(dict_path)
+    for writer in writers.values():
+        writer.commit()
+
+    return writers, source_counts, zstd_info
+
+
+# ── Training mix ───────────────────────────────────────────────────────
+#
+# Every entry is written once. How often each one is trained on is decided
+# here instead: a category's weight scales its natural token share, and
+# --token-budget rescales the whole mix to a fixed number of tokens per
+# epoch. Each category is then filled from its own seeded shuffle, whole
+# passes first (upsampling) and a subset for the remainder (or instead, to
+# downsample), picking entries while they bring its tokens closer to the
+# target. The result, mix.json, lists the entry indices in training order;
+# train_unsloth.py and train_together.py read entries in that order, so
+# repeats never cost disk space.
+
+MIX_FILE = "mix.json"
+DEFAULT_MIX_WEIGHTS = {"convention": 3.0}  # the idiom lessons used to be written 3x
+
+
+def parse_mix_weights(value: str) -> dict:
+    """Parse --mix-weights: "convention=3,cookbook=0.5" → {category: weight}."""
+    weights = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, weight = item.partition("=")
+        try:
+            weights[name.strip()] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected category=weight, got {item!r}") from None
+        if weights[name.strip()] < 0:
+            raise argparse.ArgumentTypeError(f"weights can't be negative: {item!r}")
+    return weights
+
+
+def parse_token_budget(value: str) -> int:
+    """Parse --token-budget: "2100000", "2.1M" or "500K" tokens."""
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG])?\s*', value, re.IGNORECASE)
+    if not m or float(m.group(1)) == 0:
+        raise argparse.ArgumentTypeError(f"expected a token count like 2.1M, got {value!r}")
+    return int(float(m.group(1)) * {"": 1, "K": 1e3, "M": 1e6, "G": 1e9}[(m.group(2) or "").upper()])
+
+
+class TrainingMix:
+    """Tally entries as they are written, then sample the weighted mix."""
+
+    def __init__(self, weights: dict, budget: Optional[int] = None, seed: int = 0):
+        self.weights = {**DEFAULT_MIX_WEIGHTS, **weights}
+        self.budget = budget
+        self.seed = seed
+        self.categories = []            # per entry, in output order
+        self.estimates = array("I")     # estimated tokens per entry
+
+    def add(self, category: str, messages: list[dict]):
+        self.categories.append(category)
+        self.estimates.append(sum(estimate_tokens(m["content"]) for m in messages))
+
+    def plan(self, tokens: Optional[array] = None) -> dict:
+        """Sample the mix. tokens: exact per-entry counts (from the token index), if known."""
+        tokens = tokens if tokens is not None and len(tokens) == len(self.estimates) else self.estimates
+        members = {}
+        for i, category in enumerate(self.categories):
+            members.setdefault(category, []).append(i)
+        natural = {cat: sum(tokens[i] for i in idx) for cat, idx in members.items()}
+        weighted = {cat: self.weights.get(cat, 1.0) * natural[cat] for cat in members}
+        scale = self.budget / (sum(weighted.values()) or 1) if self.budget else 1.0
+
+        order, categories = [], {}
+        for cat in sorted(members):
+            idx, target = members[cat], weighted[cat] * scale
+            passes = int(target // natural[cat]) if natural[cat] else 0
+            picked = idx * passes
+            total = passes * natural[cat]
+            # Remainder: a seeded shuffle, taking entries that move the total closer to target
+            shuffled = idx[:]
+            random.Random(f"{self.seed}:{cat}").shuffle(shuffled)
+            for i in shuffled:
+                if total >= target:
+                    break
+                if total + tokens[i] - target <= target - total:
+                    picked.append(i)
+                    total += tokens[i]
+            order.extend(picked)
+            categories[cat] = {
+                "entries": len(idx),
+                "tokens": natural[cat],
+                "weight": self.weights.get(cat, 1.0),
+                "target_tokens": round(target),
+                "sampled_entries": len(picked),
+                "sampled_tokens": total,
+            }
+        random.Random(self.seed).shuffle(order)
+        return {
+            "entries": len(self.categories),
+            "seed": self.seed,
+            "token_budget": self.budget,
+            "token_counts": "estimated" if tokens is self.estimates else "tokenizer",
+            "tokens": sum(c["sampled_tokens"] for c in categories.values()),
+            "categories": categories,
+            "order": order,
+        }
+
+
+def write_mix(path: str, plan: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        # One line per key keeps the long order list from dominating a diff
+        f.write("{\n" + ",\n".join(f"  {json.dumps(k)}: {json.dumps(v)}" for k, v in plan.items()) + "\n}\n")
+    os.replace(tmp, path)
+
+
+def print_mix(plan: dict):
+    print(f"\n── Training mix ({plan['token_counts']} tokens, seed {plan['seed']}) ──")
+    print(f"  {'category':<12}{'entries':>9}{'tokens':>12}{'weight':>8}{'sampled':>9}{'tokens':>12}{'×':>7}")
+    for cat, c in sorted(plan["categories"].items(), key=lambda x: -x[1]["sampled_tokens"]):
+        ratio = c["sampled_tokens"] / c["tokens"] if c["tokens"] else 0
+        print(f"  {cat:<12}{c['entries']:>9,}{c['tokens']:>12,}{c['weight']:>8g}"
+              f"{c['sampled_entries']:>9,}{c['sampled_tokens']:>12,}{ratio:>7.2f}")
+    budget = f" (budget {plan['token_budget']:,})" if plan["token_budget"] else ""
+    print(f"  {'total':<12}{plan['entries']:>9,}{sum(c['tokens'] for c in plan['categories'].values()):>12,}"
+          f"{'':>8}{len(plan['order']):>9,}{plan['tokens']:>12,}{budget}")
+
+
+# ── Merging with the existing output ──────────────────────────────────
+#
+# A run limited with --only/--skip rewrites every output file, so the
+# entries of the sources it doesn't convert are read back from the current
+# ChatML output first (the one format that keeps the system prompt and the
+# source ID) and slotted back in at their source's position.
+
+def existing_chatml_files(output_dir: str) -> tuple[list[str], Optional[str]]:
+    """The current ChatML files, per the manifest if there is one, and the zstd dictionary."""
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        files = [os.path.join(output_dir, shard["file"])
+                 for shard in manifest["formats"]["chatml"]["shards"]]
+        dictionary = (manifest.get("zstd") or {}).get("dictionary")
+        return files, dictionary and os.path.join(output_dir, dictionary)
+    for path in (os.path.join(output_dir, "training_data.jsonl"),
+                 os.path.join(output_dir, "training_data.jsonl.zst")):
+        if os.path.exists(path):
+            return [path], None
+    return [], None
+
+
+def load_kept_entries(output_dir: str, regenerated: set[str]) -> dict:
+    """Read back the existing entries of every source not in regenerated.
+
+    Returns {source name: [Example]}, with None for IDs no source claims.
+    """
+    files, dict_path = existing_chatml_files(output_dir)
+    decompressor = None
+    if any(path.endswith(".zst") for path in files):
+        zstandard = import_zstandard()
+        dictionary = None
+        if dict_path:
+            with open(dict_path, "rb") as f:
+                dictionary = zstandard.ZstdCompressionDict(f.read())
+        decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+
+    kept = {}
+    for path in files:
+        with open(path, "rb") as f:
+            data = f.read()
+        if path.endswith(".zst"):
+            data = decompressor.decompressobj().decompress(data)
+        for line in data.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            owner = source_owner(entry.get("source", ""))
+            if owner in regenerated:
+                continue
+            system, user, assistant = (m["content"] for m in entry["conversations"])
+            kept.setdefault(owner, []).append(
+                Example(entry["source"], user, assistant, None if system == SYSTEM_PROMPT else system))
+    return kept
+
+
+# ── Metrics report and profiling ───────────────────────────────────────
+#
+# The pipeline stages are generators pulling from one another, so a stage's
+# meter also covers everything upstream of it; the report subtracts the
+# stage before. Read, gerbilize and convert are summed over tasks, in
+# whichever processes ran them, so with --jobs they can exceed the wall time.
+
+PIPELINE_STAGES = ["sources", "chunk", "dedup", "near_dedup", "write"]
+
+
+def stage_report(meter: Meter, upstream: Optional[Meter] = None) -> dict:
+    """A stage's own share of a meter: wall/CPU seconds, RSS growth, entries/s."""
+    wall = meter.wall - (upstream.wall if upstream else 0.0)
+    return {
+        "wall_s": round(wall, 4),
+        "cpu_s": round(meter.cpu - (upstream.cpu if upstream else 0.0), 4),
+        "rss_delta_kb": meter.rss_kb - (upstream.rss_kb if upstream else 0),
+        "entries": meter.items,
+        "entries_per_s": round(meter.items / wall, 1) if wall > 0 and meter.items else None,
+    }
+
+
+def metrics_report(meters: dict, sources: dict, writers: dict, token_index: Optional[TokenIndex],
+                   run: Meter, jobs: int) -> dict:
+    """Assemble the metrics JSON: per stage, per source, and for the whole run."""
+    converted = [m for m in sources.values() if m["converted"]]
+    read_s = sum(m["read_s"] for m in converted)
+    gerbilize_s = sum(m["gerbilize_s"] for m in converted)
+    task_wall = sum(m["wall_s"] for m in converted)
+    stages = {
+        # Listing tasks, hashing inputs, reading back kept entries
+        "setup": stage_report(meters["setup"]),
+    }
+    upstream = None
+    for name in PIPELINE_STAGES:
+        if name in meters:
+            stages[name] = stage_report(meters[name], upstream)
+            upstream = meters[name]
+        if name == "sources":
+            # Inside the converters; part of "sources" when they run in this process
+            stages["read"] = {"wall_s": round(read_s, 4), "bytes": sum(m["read_bytes"] for m in converted)}
+            stages["gerbilize"] = {"wall_s": round(gerbilize_s, 4)}
+            stages["convert"] = {"wall_s": round(task_wall - read_s - gerbilize_s, 4),
+                                 "cpu_s": round(sum(m["cpu_s"] for m in converted), 4),
+                                 "tasks": sum(m["converted"] for m in converted)}
+    if token_index is not None:
+        token_index.meter.items = meters["write"].items
+        stages["tokenize"] = stage_report(token_index.meter)
+        for key in ("wall_s", "cpu_s", "rss_delta_kb"):
+            stages["write"][key] = round(stages["write"][key] - stages["tokenize"][key], 4)
+    stages["write"]["bytes"] = sum(writer.total_bytes for writer in writers.values())
+    stages["write"]["raw_bytes"] = sum(shard.get("raw_bytes", shard["bytes"])
+                                       for writer in writers.values() for shard in writer.shards)
+
+    for m in sources.values():
+        for key in ("wait_s", "wall_s", "cpu_s", "read_s", "gerbilize_s"):
+            m[key] = round(m[key], 4)
+        m["entries_per_s"] = round(m["entries"] / m["wall_s"], 1) if m["wall_s"] > 0 else None
+
+    times = os.times()
+    children_rss = (resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss if resource else 0)
+    return {
+        "jobs": jobs,
+        "total": {
+            "wall_s": round(run.wall, 4),
+            "cpu_s": round(times.user + times.system + times.children_user + times.children_system, 4),
+            "peak_rss_kb": peak_rss_kb(),
+            "worker_peak_rss_kb": children_rss // 1024 if sys.platform == "darwin" else children_rss,
+            "bytes_read": stages["read"]["bytes"],
+            "bytes_written": stages["write"]["bytes"],
+            "entries": meters["write"].items,
+            "entries_per_s": round(meters["write"].items / run.wall, 1) if run.wall > 0 else None,
+        },
+        "stages": stages,
+        "sources": sources,
+    }
+
+
+def print_metrics(report: dict):
+    print("\n── Time by stage ──")
+    for name, stage in report["stages"].items():
+        rate = f"{stage['entries_per_s']:>10,.0f}/s" if stage.get("entries_per_s") else ""
+        label = f"  {name}" if name in ("read", "gerbilize", "convert") else name  # within sources
+        print(f"  {label:<12}{stage['wall_s']:>9.3f}s{rate}")
+    total = report["total"]
+    print(f"  {'total':<12}{total['wall_s']:>9.3f}s  (CPU {total['cpu_s']:.3f}s, "
+          f"peak RSS {total['peak_rss_kb'] / 1024:.0f}MB)")
+
+
+def start_profiler(kind: str):
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("ERROR: pyinstrument not installed. Run: pip install pyinstrument")
+            sys.exit(1)
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def save_profile(profiler, path: str):
+    """cProfile → pstats file (snakeviz, pstats); pyinstrument → HTML or text by extension."""
+    if hasattr(profiler, "dump_stats"):
+        profiler.disable()
+        profiler.dump_stats(path)
+        return
+    profiler.stop()
+    with open(path, "w") as f:
+        f.write(profiler.output_html() if path.endswith(".html") else profiler.output_text(unicode=True))
+
+
+# ── Watch mode ─────────────────────────────────────────────────────────
+#
+# --watch builds once, then waits for changes under the source roots and
+# rebuilds. A rebuild goes through the build cache, so only changed inputs
+# are reconverted; chunking, dedup and writing rerun over the cached
+# entries, since near-dedup and sharding look at the whole corpus. Outputs
+# are swapped in only when complete (see write_outputs), so a failed
+# rebuild leaves the previous ones in place.
+
+WATCH_SUFFIXES = (".json", ".md", ".ss", ".scm")  # what the converters read; skips editor swap files
+WATCH_DEBOUNCE = 0.5                              # seconds of quiet before rebuilding
+WATCH_POLL_INTERVAL = 1.0
+
+
+class PollingWatcher:
+    """Finds changes by re-walking the roots and comparing sizes and mtimes."""
+
+    kind = "polling"
+
+    def __init__(self, roots: list[str], interval: float):
+        self.roots = roots
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> dict:
+        index = FileIndex(self.roots)
+        for root in self.roots:
+            index.isdir(root)  # walks it
+        return {path: (info.size, info.mtime_ns) for path, info in index.files.items()}
+
+    def wait(self, timeout: Optional[float]) -> set[str]:
+        """Paths changed since the last call; empty if none within timeout (None waits forever)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {path for path in snapshot.keys() | self.snapshot.keys()
+                       if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+            if changed:
+                return changed
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return set()
+                time.sleep(min(self.interval, remaining))
+            else:
+                time.sleep(self.interval)
+
+
+class InotifyWatcher:
+    """Linux inotify watches on every directory under the roots (inotify_simple)."""
+
+    kind = "inotify"
+
+    def __init__(self, roots: list[str]):
+        from inotify_simple import INotify, flags
+
+        self.flags = flags
+        self.inotify = INotify()
+        self.mask = (flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM
+                     | flags.CREATE | flags.DELETE)
+        self.dirs = {}  # watch descriptor → directory
+        for root in roots:
+            self._watch_tree(root)
+
+    def _watch_tree(self, root: str):
+        for dirpath, _, _ in os.walk(root):
+            self.dirs[self.inotify.add_watch(dirpath, self.mask)] = dirpath
+
+    def wait(self, timeout: Optional[float]) -> set[str]:
+        """Paths changed since the last call; empty if none within timeout (None waits forever).
+
+        Directories come back with a trailing separator.
+        """
+        events = self.inotify.read(timeout=None if timeout is None else int(timeout * 1000))
+        changed = set()
+        for event in events:
+            directory = self.dirs.get(event.wd)
+            if directory is None or not event.name:
+                continue
+            path = os.path.join(directory, event.name)
+            if event.mask & self.flags.ISDIR:
+                if event.mask & (self.flags.CREATE | self.flags.MOVED_TO):
+                    try:
+                        self._watch_tree(path)
+                    except OSError:
+                        pass
+                path += os.sep
+            changed.add(path)
+        return changed
+
+
+def make_watcher(roots: list[str], poll: bool, interval: float):
+    """inotify where available, else polling."""
+    if not poll:
+        try:
+            return InotifyWatcher(roots)
+        except ImportError:
+            print("Note: inotify_simple not installed, polling instead (pip install inotify_simple)")
+        except OSError as e:
+            # Not Linux, or out of inotify watches (fs.inotify.max_user_watches)
+            print(f"Note: inotify unavailable ({e}), polling instead")
+    return PollingWatcher(roots, interval)
+
+
+def watch(args, selected: list[Source], tokenizer=None):
+    """Rebuild whenever a source file changes, until interrupted."""
+    roots = [root for root in index_roots() if os.path.isdir(root)]
+    watcher = make_watcher(roots, args.poll, args.poll_interval)
+    ignored = tuple(os.path.join(d, "") for d in (args.output_dir, args.cache_dir))
+    print(f"\nWatching {', '.join(roots)} ({watcher.kind}); Ctrl-C to stop")
+    try:
+        while True:
+            changed = watcher.wait(None)
+            # Let a burst of saves (an editor, a git checkout) settle first
+            while True:
+                more = watcher.wait(args.debounce)
+                if not more:
+                    break
+                changed |= more
+            changed = sorted(path for path in changed
+                             if path.endswith(WATCH_SUFFIXES + (os.sep,)) and not path.startswith(ignored))
+            if not changed:
+                continue
+            print(f"\n── {time.strftime('%H:%M:%S')}: {len(changed)} changed: "
+                  + ", ".join(os.path.basename(path.rstrip(os.sep)) for path in changed[:5])
+                  + (" ..." if len(changed) > 5 else "") + " ──")
+            forget_sources()
+            try:
+                build(args, selected, tokenizer)
+            except Exception as e:
+                # e.g. a JSON file saved half-way; the next save triggers another try
+                print(f"\nRebuild failed, previous output kept: {type(e).__name__}: {e}")
+    except KeyboardInterrupt:
+        print("\nStopped watching")
 
 
 # ═══════════════════════════════════════════════════════════════════════
 # Main
 # ═══════════════════════════════════════════════════════════════════════
 
-def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-    all_chatml = []
-    all_alpaca = []
-
-    # ── 1. Cookbooks ──────────────────────────────────────────────────
-    print("Converting cookbooks.json ...")
-    with open(os.path.join(MCP_DIR, "cookbooks.json")) as f:
-        recipes = json.load(f)
-    c, a = convert_cookbooks(recipes)
-    all_chatml.extend(c)
-    all_alpaca.extend(a)
-    print(f"  → {len(c)} ChatML, {len(a)} Alpaca entries")
-
-    # ── 2. Security Rules ─────────────────────────────────────────────
-    print("Converting security-rules.json ...")
-    with open(os.path.join(MCP_DIR, "security-rules.json")) as f:
-        rules = json.load(f)
-    c, a = convert_security_rules(rules)
-    all_chatml.extend(c)
-    all_alpaca.extend(a)
-    print(f"  → {len(c)} ChatML, {len(a)} Alpaca entries")
-
-    # ── 3. Error Fixes ────────────────────────────────────────────────
-    print("Converting error-fixes.json ...")
-    with open(os.path.join(MCP_DIR, "error-fixes.json")) as f:
-        fixes = json.load(f)
-    c, a = convert_error_fixes(fixes)
-    all_chatml.extend(c)
-    all_alpaca.extend(a)
-    print(f"  → {len(c)} ChatML, {len(a)} Alpaca entries")
-
-    # ── 4. Resource MDs ───────────────────────────────────────────────
-    print("Converting gerbil-mcp resource docs ...")
-    c, a = convert_resource_mds()
-    all_chatml.extend(c)
-    all_alpaca.extend(a)
-    print(f"  → {len(c)} ChatML, {len(a)} Alpaca entries")
-
-    # ── 5. Guide Docs ─────────────────────────────────────────────────
-    print("Converting Gerbil guide docs ...")
-    c, a = convert_guide_docs()
-    all_chatml.extend(c)
-    all_alpaca.extend(a)
-    print(f"  → {len(c)} ChatML, {len(a)} Alpaca entries")
-
-    # ── 6. All Reference Docs ─────────────────────────────────────────
-    print("Converting Gerbil reference docs ...")
-    c, a = convert_all_reference_docs()
-    all_chatml.extend(c)
-    all_alpaca.extend(a)
-    print(f"  → {len(c)} ChatML, {len(a)} Alpaca entries")
-
-    # ── 7. Tutorials ──────────────────────────────────────────────────
-    print("Converting tutorials ...")
-    c, a = convert_all_tutorials()
-    all_chatml.extend(c)
-    all_alpaca.extend(a)
-    print(f"  → {len(c)} ChatML, {len(a)} Alpaca entries")
-
-    # ── 8. Gambit Examples ────────────────────────────────────────────
-    print("Converting Gambit examples ...")
-    c, a = convert_gambit_examples()
-    all_chatml.extend(c)
-    all_alpaca.extend(a)
-    print(f"  → {len(c)} ChatML, {len(a)} Alpaca entries")
-
-    # ── 9. Test Files ─────────────────────────────────────────────────
-    print("Converting test files ...")
-    c, a = convert_test_files()
-    all_chatml.extend(c)
-    all_alpaca.extend(a)
-    print(f"  → {len(c)} ChatML, {len(a)} Alpaca entries")
-
-    # ── 10. Std Source ────────────────────────────────────────────────
-    print("Converting std library source ...")
-    c, a = convert_std_source_files()
-    all_chatml.extend(c)
-    all_alpaca.extend(a)
-    print(f"  → {len(c)} ChatML, {len(a)} Alpaca entries")
-
-    # ── 11. Convention Examples ────────────────────────────────────────
-    print("Generating Gerbil convention examples ...")
-    c, a = generate_convention_entries()
-    all_chatml.extend(c)
-    all_alpaca.extend(a)
-    print(f"  → {len(c)} ChatML, {len(a)} Alpaca entries")
-
-    # ── Gerbilize all entries ─────────────────────────────────────────
-    print("\nGerbilizing: converting (define → (def, (define-macro → (defmacro ...")
-    all_chatml = [gerbilize_entry(e) for e in all_chatml]
-    all_alpaca = [gerbilize_alpaca(e) for e in all_alpaca]
-
-    # ── Dedup and write ──────────────────────────────────────────────
-    print(f"\nTotal before dedup: {len(all_chatml)} ChatML, {len(all_alpaca)} Alpaca")
-
-    all_chatml = deduplicate(all_chatml, "source")
-    all_alpaca = deduplicate(all_alpaca, "source")
-
-    print(f"Total after dedup:  {len(all_chatml)} ChatML, {len(all_alpaca)} Alpaca")
-
-    # Write ChatML/ShareGPT format (for Axolotl, LLaMA-Factory)
-    chatml_path = os.path.join(OUTPUT_DIR, "training_data.jsonl")
-    with open(chatml_path, "w") as f:
-        for entry in all_chatml:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-    print(f"\nWrote {chatml_path}")
-
-    # Write Together AI format: {"messages": [...]} per line, no extra fields
-    together_path = os.path.join(OUTPUT_DIR, "training_data_together.jsonl")
-    with open(together_path, "w") as f:
-        for entry in all_chatml:
-            together_entry = {"messages": entry["conversations"]}
-            f.write(json.dumps(together_entry, ensure_ascii=False) + "\n")
-    print(f"Wrote {together_path}")
-
-    # Write Alpaca format
-    alpaca_path = os.path.join(OUTPUT_DIR, "training_data_alpaca.jsonl")
-    with open(alpaca_path, "w") as f:
-        for entry in all_alpaca:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-    print(f"Wrote {alpaca_path}")
-
-    # Write a combined JSON array (some tools prefer this)
-    alpaca_json_path = os.path.join(OUTPUT_DIR, "training_data_alpaca.json")
-    with open(alpaca_json_path, "w") as f:
-        json.dump(all_alpaca, f, ensure_ascii=False, indent=2)
-    print(f"Wrote {alpaca_json_path}")
+def build(args, selected: list[Source], tokenizer=None):
+    """Convert the selected sources, merge, dedup and write every output once."""
+    partial = len(selected) < len(SOURCES)
+    output_dir, cache_dir, jobs = args.output_dir, args.cache_dir, args.jobs
+    max_entries, max_bytes = args.shard_size or (None, None)
+
+    os.makedirs(output_dir, exist_ok=True)
+    run_meter = Meter().start()
+    profiler = start_profiler(args.profiler) if args.profile else None
+    try:
+        meters = {"setup": Meter().start()}
+        token_index = None
+        if tokenizer is not None:
+            token_index = TokenIndex(tokenizer,
+                                     os.path.join(output_dir, "token_index.jsonl"), args.max_seq_length,
+                                     os.path.join(output_dir, "pretokenized") if args.pretokenize else None)
+
+        # Read back what the unselected sources contributed before it's overwritten
+        kept = None
+        if partial:
+            kept = load_kept_entries(output_dir, {src.name for src in selected})
+            if not kept:
+                print(f"Note: no existing output in {output_dir}/ to merge into; "
+                      f"writing only {', '.join(src.name for src in selected)}")
+
+        # List every task up front so one pool can work across all sources
+        plan = [(src, src.list_tasks() if src in selected else None) for src in SOURCES]
+        results, cache_stats = run_cached([task for _, tasks in plan for task in tasks or []], jobs,
+                                          None if args.no_cache else cache_dir, prune=not partial)
+        meters["setup"].stop()
+
+        # ── Convert → dedup → write, one entry at a time ─────────────
+        dedup_stats = {"before": 0, "after": 0, "near_dups": 0}
+        chunk_stats = {"chunked": 0, "parts": 0}
+        clusters = {}
+        source_metrics = {}
+        # Each stage is metered as it's pulled through; see metrics_report
+        meters.update((name, Meter()) for name in PIPELINE_STAGES)
+        examples = metered(iter_source_entries(plan, results, kept, source_metrics), meters["sources"])
+        if args.chunk_tokens > 0:
+            examples = metered(chunk_examples(examples, args.chunk_tokens, chunk_stats), meters["chunk"])
+        else:
+            del meters["chunk"]
+        examples = metered(deduplicate(examples, dedup_stats), meters["dedup"])
+        if not args.no_near_dedup:
+            examples = metered(near_deduplicate(examples, args.near_dup_threshold, clusters, dedup_stats),
+                               meters["near_dedup"])
+        else:
+            del meters["near_dedup"]
+        mix = TrainingMix(args.mix_weights, args.token_budget, args.mix_seed)
+        with meters["write"]:
+            writers, source_counts, zstd_info = write_outputs(examples, output_dir, token_index,
+                                                              max_entries, max_bytes, args.zstd, mix)
+            manifest_path = os.path.join(output_dir, "manifest.json")
+            write_manifest(manifest_path, writers, source_counts, zstd_info)
+            mix_plan = mix.plan(token_index.entry_tokens if token_index is not None else None)
+            mix_path = os.path.join(output_dir, MIX_FILE)
+            write_mix(mix_path, mix_plan)
+        meters["write"].items = sum(source_counts.values())
+    finally:
+        # Also on failure: under --watch a profiler left enabled would record every later rebuild
+        if profiler is not None:
+            save_profile(profiler, args.profile)
+
+    run_meter.stop()
+    metrics = metrics_report(meters, source_metrics, writers, token_index, run_meter, jobs)
+    metrics_path = args.metrics or os.path.join(output_dir, "convert_metrics.json")
+    with open(metrics_path, "w") as f:
+        json.dump(metrics, f, indent=2)
+
+    if not args.no_cache:
+        print(f"\nBuild cache: {cache_stats['hits']} unchanged, {cache_stats['misses']} converted, "
+              f"{cache_stats['pruned']} stale entries pruned"
+              + (" (pruning skipped: only some sources converted)" if partial else ""))
+
+    if chunk_stats["chunked"]:
+        print(f"\n{chunk_stats['chunked']} long entries split into {chunk_stats['parts']} parts "
+              f"of at most ~{args.chunk_tokens} tokens")
+
+    print(f"\nTotal before dedup: {dedup_stats['before']}")
+    print(f"Total after dedup:  {dedup_stats['after'] - dedup_stats['near_dups']}")
+    if not args.no_near_dedup:
+        report_path = os.path.join(output_dir, "near_duplicates.json")
+        report_clusters = clusters
+        if partial:
+            report_clusters = load_near_dup_clusters(report_path, {src.name for src in selected})
+            for kept_doc, dropped in clusters.items():
+                report_clusters.setdefault(kept_doc, []).extend(dropped)
+        write_near_dup_report(report_path, report_clusters, args.near_dup_threshold)
+        print(f"  {dedup_stats['near_dups']} near-duplicates collapsed into {len(clusters)} clusters "
+              f"(threshold {args.near_dup_threshold}), see {report_path}"
+              + (" (merged with the sources not reconverted)" if partial else ""))
+        for kept, dropped in sorted(clusters.items(), key=lambda x: -len(x[1]))[:5]:
+            print(f"    {kept} ← {', '.join(sid for sid, _ in dropped[:3])}"
+                  f"{' ...' if len(dropped) > 3 else ''}")
+
+    print()
+    for writer in writers.values():
+        if writer.sharded:
+            print(f"Wrote {writer.path}: {len(writer.shards)} shards "
+                  f"({writer.shards[0]['file']} … {writer.shards[-1]['file']})")
+        else:
+            print(f"Wrote {writer.path}")
+    if zstd_info and zstd_info["dictionary"]:
+        print(f"Wrote {os.path.join(output_dir, ZSTD_DICT_FILE)} (zstd dictionary for the shards)")
+    print(f"Wrote {manifest_path}")
+    print(f"Wrote {mix_path}")
 
     # Print stats by source
     print("\n── Stats by source category ──")
-    source_counts = {}
-    for entry in all_chatml:
-        src = entry.get("source", "unknown")
-        category = src.split(":")[0]
-        source_counts[category] = source_counts.get(category, 0) + 1
     for cat, count in sorted(source_counts.items(), key=lambda x: -x[1]):
         print(f"  {cat}: {count}")
 
     # Print total size
-    chatml_size = os.path.getsize(chatml_path)
-    together_size = os.path.getsize(together_path)
-    alpaca_size = os.path.getsize(alpaca_path)
+    chatml_size = writers["chatml"].total_bytes
+    together_size = writers["together"].total_bytes
+    alpaca_size = writers["alpaca"].total_bytes
     print(f"\nFile sizes: ChatML={chatml_size/1024/1024:.1f}MB, Together={together_size/1024/1024:.1f}MB, Alpaca={alpaca_size/1024/1024:.1f}MB")
 
+    if token_index is not None:
+        print(f"\nWrote {token_index.path}")
+        if token_index.pretokenized_dir:
+            print(f"Wrote {token_index.pretokenized_dir}/ ({token_index.offsets[-1]:,} tokens)")
+        token_index.report()
+
+    print_mix(mix_plan)
+
+    print_metrics(metrics)
+    print(f"\nWrote {metrics_path}")
+    if args.profile:
+        print(f"Wrote {args.profile} ({args.profiler} profile of the main process)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Gerbil sources into LoRA training data")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="Worker processes for conversion (0 = one per CPU, default: 1)")
+    parser.add_argument("--only", metavar="NAMES",
+                        help="Convert only these comma-separated sources or categories; the other "
+                             "sources' entries are kept from the existing output")
+    parser.add_argument("--skip", metavar="NAMES",
+                        help="Don't convert these sources or categories; keep their existing entries")
+    parser.add_argument("--list-sources", action="store_true",
+                        help="List the source names for --only/--skip and exit")
+    parser.add_argument("--mcp-dir", default=MCP_DIR, help=f"gerbil-mcp checkout (default: {MCP_DIR})")
+    parser.add_argument("--gerbil-dir", default=GERBIL_DIR, help=f"Gerbil checkout (default: {GERBIL_DIR})")
+    parser.add_argument("--gambit-dir", default=GAMBIT_DIR, help=f"Gambit checkout (default: {GAMBIT_DIR})")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help=f"Where to write the data (default: {OUTPUT_DIR})")
+    parser.add_argument("--cache-dir",
+                        help="Incremental build cache directory (default: OUTPUT_DIR/.convert_cache)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Convert every input from scratch and leave the cache untouched")
+    parser.add_argument("--near-dup-threshold", type=float, default=NEAR_DUP_THRESHOLD,
+                        help=f"Similarity above which examples are collapsed (default: {NEAR_DUP_THRESHOLD})")
+    parser.add_argument("--no-near-dedup", action="store_true",
+                        help="Only drop exact source-ID repeats")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS,
+                        help=f"Split answers longer than this many (estimated) tokens into parts "
+                             f"(0 = never split, default: {CHUNK_TOKENS})")
+    parser.add_argument("--shard-size", type=parse_shard_size, metavar="N|SIZE",
+                        help="Split each output format into shards of N entries or SIZE bytes (e.g. 5000, 4MB)")
+    parser.add_argument("--zstd", action="store_true",
+                        help="Write the JSONL formats as zstd-compressed .jsonl.zst")
+    parser.add_argument("--mix-weights", type=parse_mix_weights, default={}, metavar="CAT=W,...",
+                        help="Scale categories' share of the training mix, e.g. cookbook=0.5,doc=2 "
+                             f"(default weight 1; {', '.join(f'{k}={v:g}' for k, v in DEFAULT_MIX_WEIGHTS.items())})")
+    parser.add_argument("--token-budget", type=parse_token_budget, metavar="N",
+                        help="Sample the mix to about N tokens per epoch, e.g. 2.1M "
+                             "(default: every entry once, times its weight)")
+    parser.add_argument("--mix-seed", type=int, default=0,
+                        help="Seed for the training mix sample (default: 0)")
+    parser.add_argument("--token-index", action="store_true",
+                        help="Tokenize every entry and write token_index.jsonl plus a length report")
+    parser.add_argument("--pretokenize", action="store_true",
+                        help="Also write the ChatML entries as token ids for train_unsloth.py "
+                             "(pretokenized/, implies --token-index)")
+    parser.add_argument("--tokenizer", default=TOKENIZER_NAME,
+                        help=f"Locally cached tokenizer for --token-index/--pretokenize (default: {TOKENIZER_NAME})")
+    parser.add_argument("--max-seq-length", type=int, default=MAX_SEQ_LENGTH,
+                        help=f"Token budget flagged by --token-index (default: {MAX_SEQ_LENGTH})")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Per-stage and per-source timing report (default: OUTPUT_DIR/convert_metrics.json)")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Profile the main process and save the result to PATH "
+                             "(workers are not profiled; use --jobs 1 to see the converters)")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile",
+                        help="Profiler for --profile: cProfile stats, or pyinstrument HTML/text (default: cprofile)")
+    parser.add_argument("--watch", action="store_true",
+                        help="After converting, keep running and rebuild whenever a source file changes")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE,
+                        help=f"Seconds without changes before --watch rebuilds (default: {WATCH_DEBOUNCE})")
+    parser.add_argument("--poll", action="store_true",
+                        help="Make --watch poll the source trees instead of using inotify")
+    parser.add_argument("--poll-interval", type=float, default=WATCH_POLL_INTERVAL,
+                        help=f"Seconds between scans when polling (default: {WATCH_POLL_INTERVAL})")
+    args = parser.parse_args()
+    if args.list_sources:
+        for src in SOURCES:
+            print(f"  {src.name:<12} {', '.join(src.prefixes)}")
+        return
+    try:
+        selected = select_sources(args.only, args.skip)
+    except ValueError as e:
+        parser.error(str(e))
+    if not selected:
+        parser.error("--only/--skip leave no source to convert")
+    set_source_dirs(*(os.path.abspath(os.path.expanduser(d))
+                      for d in (args.mcp_dir, args.gerbil_dir, args.gambit_dir)))
+    args.output_dir = os.path.abspath(os.path.expanduser(args.output_dir))
+    args.cache_dir = args.cache_dir or os.path.join(args.output_dir, ".convert_cache")
+    args.jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    if not 0 < args.near_dup_threshold <= 1:
+        parser.error("--near-dup-threshold must be in (0, 1]")
+    if args.chunk_tokens < 0:
+        parser.error("--chunk-tokens must be >= 0")
+    if args.watch and args.no_cache:
+        parser.error("--watch relies on the build cache to reconvert only what changed; drop --no-cache")
+
+    # Check optional dependencies before converting so they fail fast
+    if args.zstd:
+        import_zstandard()
+    tokenizer = None
+    if args.token_index or args.pretokenize:
+        tokenizer = load_tokenizer(args.tokenizer)
+
+    build(args, selected, tokenizer)
+    if args.watch:
+        watch(args, selected, tokenizer)
+
 
 if __name__ == "__main__":
     main()
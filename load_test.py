@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Open-loop load test for an OpenAI-compatible endpoint (RunPod vLLM, Ollama, ...).
+
+Replays the verify_model.py prompts (or a --suite) at a target arrival rate. Requests are
+sent on schedule whether or not earlier ones have finished, the way
+independent users arrive. The test reports throughput, error and timeout
+rates, queueing delay and latency percentiles, for the whole run and per
+time window, so a scale-from-zero cold start shows up in the first windows.
+Latencies are measured from each request's scheduled arrival, so a
+generator that falls behind doesn't hide the delay (coordinated omission).
+
+Usage:
+  # 2 requests/s on average (Poisson), ramping up over 30s, for 5 minutes
+  python3 load_test.py --base-url https://api.runpod.ai/v2/<ENDPOINT_ID>/openai/v1 \\
+      --model jaimef21/gerbil-qwen-7b --api-key $RUNPOD_API_KEY --rate 2 --ramp 30 --duration 300
+
+  # Against a local stand-in server (simulated slots, decode rate and cold start)
+  python3 load_test.py --stand-in --rate 20 --duration 30
+
+  # Just run the stand-in server, e.g. for verify_model.py --bench
+  python3 load_test.py --serve 8000
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from verify_model import TEST_CASES, AsyncOpenAI, load_suite, percentile, timed_stream
+
+DEFAULT_TIMEOUT = 120.0  # seconds for a whole request, queueing included
+DEFAULT_WINDOW = 10.0    # seconds per row of the over-time report
+
+
+# ═══════════════════════════════════════════════════════════════════════
+# Arrival schedule
+# ═══════════════════════════════════════════════════════════════════════
+
+def arrival_times(rate: float, duration: float, ramp: float, process: str, seed: int) -> list[float]:
+    """Request start times in seconds.
+
+    The rate climbs linearly from 0 to `rate` over the first `ramp` seconds,
+    then holds. "constant" spaces requests evenly along that curve; "poisson"
+    draws exponential gaps, thinned during the ramp.
+    """
+    times = []
+    if process == "constant":
+        # The k-th request goes out when the expected count reaches k
+        k = 0
+        while True:
+            if ramp and k <= rate * ramp / 2:
+                t = math.sqrt(2 * ramp * k / rate)
+            else:
+                t = k / rate + ramp / 2
+            if t >= duration:
+                return times
+            times.append(t)
+            k += 1
+
+    rng = random.Random(seed)
+    t = 0.0
+    while True:
+        t += rng.expovariate(rate)
+        if t >= duration:
+            return times
+        if t >= ramp or rng.random() < t / ramp:
+            times.append(t)
+
+
+# ═══════════════════════════════════════════════════════════════════════
+# Load generator
+# ═══════════════════════════════════════════════════════════════════════
+
+async def fire(client, model: str, prompt: str, scheduled: float, t0: float, timeout: float) -> dict:
+    """Send one streamed request. Returns its record, times relative to the test start."""
+    record = {"scheduled": scheduled, "lag": time.perf_counter() - t0 - scheduled}
+    try:
+        sample = await asyncio.wait_for(timed_stream(client, model, prompt), timeout)
+    except asyncio.TimeoutError:
+        record["status"] = "timeout"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"[:200]
+    else:
+        record["status"] = "ok"
+        record.update(sample)
+        # Measured from the scheduled arrival: queueing behind a slow
+        # generator counts against the endpoint, as a user would see it
+        for key in ("headers", "ttft", "total"):
+            record[key] += record["lag"]
+    record["done"] = time.perf_counter() - t0
+    return record
+
+
+async def progress(tasks: list, window: float, t0: float):
+    """Print a status line every window while the test runs."""
+    while True:
+        await asyncio.sleep(window)
+        done = [task.result() for task in tasks if task.done()]
+        failed = sum(1 for record in done if record["status"] != "ok")
+        print(f"  {time.perf_counter() - t0:6.0f}s  sent {len(tasks):5}  done {len(done):5}  "
+              f"in flight {len(tasks) - len(done):4}  failed {failed}", flush=True)
+
+
+async def run_load(args, base_url: str, schedule: list[float]) -> tuple[list[dict], float]:
+    prompts = [test["prompt"] for test in args.test_cases]
+    # No retries by default: a retry would hide exactly the errors a load test is for
+    client = AsyncOpenAI(base_url=base_url, api_key=args.api_key,
+                         timeout=args.timeout, max_retries=args.retries)
+    async with client:
+        t0 = time.perf_counter()
+        tasks = []
+        reporter = asyncio.ensure_future(progress(tasks, args.window, t0))
+        for i, at in enumerate(schedule):
+            delay = t0 + at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(
+                fire(client, args.model, prompts[i % len(prompts)], at, t0, args.timeout)))
+        records = await asyncio.gather(*tasks)
+        reporter.cancel()
+        return list(records), time.perf_counter() - t0
+
+
+# ═══════════════════════════════════════════════════════════════════════
+# Report
+# ═══════════════════════════════════════════════════════════════════════
+
+LATENCY_METRICS = [
+    # (label, record key, scale)
+    ("queue (ms)", "headers", 1000),
+    ("TTFT (ms)", "ttft", 1000),
+    ("inter-token (ms)", "itl", 1000),
+    ("total (s)", "total", 1),
+    ("client lag (ms)", "lag", 1000),
+]
+
+
+def latency_stats(records: list[dict], key: str) -> dict:
+    if key == "itl":
+        values = [gap for record in records for gap in record["itl"]]
+    else:
+        values = [record[key] for record in records]
+    if not values:
+        return {}
+    return {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+
+
+def windows(records: list[dict], size: float, duration: float) -> list[dict]:
+    """Per-window stats, grouping requests by scheduled arrival."""
+    rows = []
+    for n in range(max(1, math.ceil(duration / size))):
+        start = n * size
+        batch = [record for record in records if start <= record["scheduled"] < start + size]
+        ok = [record for record in batch if record["status"] == "ok"]
+        rows.append({
+            "start": start,
+            "sent": len(batch),
+            "ok": len(ok),
+            "errors": sum(1 for record in batch if record["status"] == "error"),
+            "timeouts": sum(1 for record in batch if record["status"] == "timeout"),
+            "tokens_per_s": sum(record["tokens"] for record in ok) / size,
+            "ttft": latency_stats(ok, "ttft"),
+            "total": latency_stats(ok, "total"),
+        })
+    return rows
+
+
+def summarize(records: list[dict], wall: float, window: float, duration: float) -> dict:
+    ok = [record for record in records if record["status"] == "ok"]
+    n = len(records) or 1
+    return {
+        "requests": len(records),
+        "ok": len(ok),
+        "error_rate": sum(1 for record in records if record["status"] == "error") / n,
+        "timeout_rate": sum(1 for record in records if record["status"] == "timeout") / n,
+        "requests_per_s": len(ok) / wall,
+        "tokens_per_s": sum(record["tokens"] for record in ok) / wall,
+        "latency": {key: latency_stats(ok, key) for _, key, _ in LATENCY_METRICS},
+        "windows": windows(records, window, duration),
+    }
+
+
+def print_report(summary: dict, records: list[dict], wall: float):
+    def ms(stats, p):
+        return f"{stats[p] * 1000:>7.0f}" if stats else f"{'-':>7}"
+
+    print(f"\n── Over time (by arrival) ──")
+    print(f"  {'window':>9}{'sent':>6}{'ok':>6}{'err':>5}{'tmo':>5}{'tok/s':>8}"
+          f"{'TTFT p50':>10}{'p95':>7}{'total p95':>11}")
+    for row in summary["windows"]:
+        total = f"{row['total']['p95']:>10.1f}s" if row["total"] else f"{'-':>11}"
+        print(f"  {row['start']:>8.0f}s{row['sent']:>6}{row['ok']:>6}{row['errors']:>5}{row['timeouts']:>5}"
+              f"{row['tokens_per_s']:>8.1f}{ms(row['ttft'], 'p50'):>10}{ms(row['ttft'], 'p95')}{total}")
+
+    print(f"\n── Latency ({summary['ok']} successful requests) ──")
+    print(f"  {'':<18}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for label, key, scale in LATENCY_METRICS:
+        stats = summary["latency"][key]
+        if stats:
+            print(f"  {label:<18}" + "".join(f"{stats[p] * scale:>9.1f}" for p in ("p50", "p95", "p99")))
+
+    print(f"\nThroughput: {summary['requests_per_s']:.2f} req/s, {summary['tokens_per_s']:.1f} tok/s "
+          f"over {wall:.1f}s")
+    print(f"Errors: {summary['error_rate']:.1%}, timeouts: {summary['timeout_rate']:.1%} "
+          f"of {summary['requests']} requests")
+    errors = sorted({record["error"] for record in records if record["status"] == "error"})
+    for error in errors[:5]:
+        print(f"  {error}")
+    lag = summary["latency"]["lag"]
+    if lag and lag["p99"] > 0.05:
+        print(f"Note: requests went out up to {lag['p99'] * 1000:.0f}ms late (p99); the load generator "
+              f"couldn't keep up, so the offered rate was lower than asked")
+
+
+# ═══════════════════════════════════════════════════════════════════════
+# Stand-in server
+# ═══════════════════════════════════════════════════════════════════════
+#
+# A local OpenAI-compatible /v1/chat/completions endpoint that behaves like
+# a small GPU server: `slots` requests generate at once and the rest wait,
+# each reply streams `tokens` tokens at `tps` per second after a prefill
+# delay, and the first request can wait out a cold start. Headers go out
+# once a slot is free, so waiting shows up as queueing delay.
+
+STAND_IN_REPLY = ("(import :std/iter :std/sugar) (def (count-words text) "
+                  "(let (counts (make-hash-table)) (for (w (string-split text #\\space)) "
+                  "(hash-update! counts w 1+ 0)) counts)) ").split(" ")
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # the default of 5 drops connections under a burst
+
+    def __init__(self, port: int, slots: int, tps: float, tokens: int, prefill: float, cold_start: float):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.slots = threading.Semaphore(slots)
+        self.tps, self.tokens, self.prefill = tps, tokens, prefill
+        self.warm_at = None if cold_start else 0.0
+        self.cold_start = cold_start
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return  # the client gave up, e.g. on a timeout
+        super().handle_error(request, client_address)
+
+    def wait_warm(self):
+        """Block until the simulated cold start, begun by the first request, is over."""
+        with self.lock:
+            if self.warm_at is None:
+                self.warm_at = time.monotonic() + self.cold_start
+        time.sleep(max(0.0, self.warm_at - time.monotonic()))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "stand-in", "object": "model"}]})
+        else:
+            self.send_json(404, {"error": {"message": f"no route {self.path}"}})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"no route {self.path}"}})
+            return
+        server = self.server
+        n = min(request.get("max_tokens") or server.tokens, server.tokens)
+        words = [STAND_IN_REPLY[i % len(STAND_IN_REPLY)] + " " for i in range(n)]
+        base = {"id": "chatcmpl-stand-in", "created": int(time.time()), "model": request.get("model", "")}
+
+        server.wait_warm()
+        with server.slots:
+            if not request.get("stream"):
+                time.sleep(server.prefill + n / server.tps)
+                self.send_json(200, {**base, "object": "chat.completion", "choices": [
+                    {"index": 0, "finish_reason": "length",
+                     "message": {"role": "assistant", "content": "".join(words)}}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": n, "total_tokens": n}})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(server.prefill)
+            chunk = {**base, "object": "chat.completion.chunk"}
+            for word in words:
+                self.send_event({**chunk, "choices": [{"index": 0, "delta": {"content": word},
+                                                       "finish_reason": None}]})
+                time.sleep(1 / server.tps)
+            if (request.get("stream_options") or {}).get("include_usage"):
+                self.send_event({**chunk, "choices": [],
+                                 "usage": {"prompt_tokens": 0, "completion_tokens": n, "total_tokens": n}})
+            self.send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    def send_event(self, data):
+        payload = f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode()
+        self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stand_in(args) -> StandInServer:
+    server = StandInServer(args.port, args.slots, args.tps, args.tokens, args.prefill, args.cold_start)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ═══════════════════════════════════════════════════════════════════════
+# Main
+# ═══════════════════════════════════════════════════════════════════════
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load test for an OpenAI-compatible endpoint")
+    parser.add_argument("--base-url", help="API base URL")
+    parser.add_argument("--model", help="Model name/ID")
+    parser.add_argument("--api-key", default="not-needed", help="API key")
+    parser.add_argument("--rate", type=float, default=1.0, help="Target arrivals per second (default: 1)")
+    parser.add_argument("--arrivals", choices=["poisson", "constant"], default="poisson",
+                        help="Arrival process (default: poisson)")
+    parser.add_argument("--duration", type=float, default=60.0,
+                        help="Seconds to keep sending, ramp included (default: 60)")
+    parser.add_argument("--ramp", type=float, default=0.0,
+                        help="Seconds to climb linearly from 0 to --rate (default: 0)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help=f"Seconds before a request counts as timed out (default: {DEFAULT_TIMEOUT:g})")
+    parser.add_argument("--retries", type=int, default=0, help="Client retries per request (default: 0)")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW,
+                        help=f"Seconds per row of the over-time report (default: {DEFAULT_WINDOW:g})")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for Poisson arrivals (default: 0)")
+    parser.add_argument("--suite", action="append", metavar="PATH",
+                        help="Replay the prompts of this verify_model.py JSONL suite; repeatable")
+    parser.add_argument("--output", help="Save the summary and per-request records as JSON")
+
+    stand_in = parser.add_argument_group("stand-in server")
+    stand_in.add_argument("--stand-in", action="store_true",
+                          help="Start a local stand-in server and test against it")
+    stand_in.add_argument("--serve", type=int, metavar="PORT",
+                          help="Only run the stand-in server on PORT, until interrupted")
+    stand_in.add_argument("--port", type=int, default=0, help="Port for --stand-in (default: any free port)")
+    stand_in.add_argument("--slots", type=int, default=4, help="Requests generated at once (default: 4)")
+    stand_in.add_argument("--tps", type=float, default=35.0, help="Tokens/s per request (default: 35)")
+    stand_in.add_argument("--tokens", type=int, default=200, help="Tokens per reply (default: 200)")
+    stand_in.add_argument("--prefill", type=float, default=0.1,
+                          help="Seconds before the first token (default: 0.1)")
+    stand_in.add_argument("--cold-start", type=float, default=0.0,
+                          help="Seconds the first request waits, as on scale-from-zero (default: 0)")
+    args = parser.parse_args()
+    args.test_cases = TEST_CASES
+    if args.suite:
+        try:
+            args.test_cases = [case for path in args.suite for case in load_suite(path)]
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        if not args.test_cases:
+            parser.error("the suite has no test cases")
+
+    if args.serve is not None:
+        args.port = args.serve
+        server = StandInServer(args.port, args.slots, args.tps, args.tokens, args.prefill, args.cold_start)
+        print(f"Stand-in server on http://127.0.0.1:{args.port}/v1 "
+              f"({args.slots} slots, {args.tps:g} tok/s, {args.tokens} tokens); Ctrl-C to stop")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.stand_in:
+        server = start_stand_in(args)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        args.model = args.model or "stand-in"
+    elif not args.base_url or not args.model:
+        parser.error("--base-url and --model are required (or use --stand-in)")
+    else:
+        base_url = args.base_url
+    if args.rate <= 0 or args.duration <= 0 or args.window <= 0:
+        parser.error("--rate, --duration and --window must be positive")
+    if not 0 <= args.ramp <= args.duration:
+        parser.error("--ramp must be between 0 and --duration")
+
+    schedule = arrival_times(args.rate, args.duration, args.ramp, args.arrivals, args.seed)
+    print(f"Load test: {base_url} ({args.model}), {len(schedule)} requests over {args.duration:g}s "
+          f"({args.arrivals}, {args.rate:g}/s" + (f", {args.ramp:g}s ramp" if args.ramp else "") + ")")
+    records, wall = asyncio.run(run_load(args, base_url, schedule))
+    summary = summarize(records, wall, args.window, args.duration)
+    print_report(summary, records, wall)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"base_url": base_url, "model": args.model, "rate": args.rate,
+                       "arrivals": args.arrivals, "duration": args.duration, "ramp": args.ramp,
+                       "wall_s": wall, "summary": summary, "records": records}, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
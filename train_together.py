@@ -7,16 +7,19 @@ Prerequisites:
   export TOGETHER_API_KEY="your-key-here"
 
 Usage:
-  python3 train_together.py upload     # Upload training data
+  python3 train_together.py upload     # Upload training data (.jsonl, .jsonl.zst or shards), in mix.json order
   python3 train_together.py train      # Start fine-tuning (after upload)
   python3 train_together.py status     # Check training status
   python3 train_together.py test       # Test the fine-tuned model
 """
 
 import sys
+import io
 import os
 import json
 import time
+import tempfile
+from typing import Optional
 
 try:
     from together import Together
@@ -27,7 +30,9 @@ except ImportError:
 # ── Config ──────────────────────────────────────────────────────────
 BASE_MODEL = "Qwen/Qwen2.5-7B-Instruct"
 TRAINING_FILE = os.path.join(os.path.dirname(__file__), "training_data_together.jsonl")
+MANIFEST_FILE = os.path.join(os.path.dirname(__file__), "manifest.json")  # see convert_training_data.py --shard-size
 STATE_FILE = os.path.join(os.path.dirname(__file__), ".together_state.json")
+MIX_FILE = os.path.join(os.path.dirname(__file__), "mix.json")  # see convert_training_data.py --token-budget
 
 LORA_R = 16
 LORA_ALPHA = 32
@@ -48,12 +53,101 @@ def save_state(state):
         json.dump(state, f, indent=2)
 
 
+def load_mix():
+    """The training mix written by convert_training_data.py, if any."""
+    if not os.path.exists(MIX_FILE):
+        return None
+    with open(MIX_FILE) as f:
+        return json.load(f)
+
+
+def training_files() -> tuple[list[str], Optional[str]]:
+    """The Together-format data (the manifest's shards, or the single file) and its zstd dictionary."""
+    data_dir = os.path.dirname(TRAINING_FILE)
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE) as f:
+            manifest = json.load(f)
+        files = [os.path.join(data_dir, shard["file"]) for shard in manifest["formats"]["together"]["shards"]]
+        dictionary = (manifest.get("zstd") or {}).get("dictionary")
+        if all(os.path.exists(path) for path in files):
+            return files, dictionary and os.path.join(data_dir, dictionary)
+        print(f"Ignoring {MANIFEST_FILE}: some of its files are missing")
+    for path in (TRAINING_FILE, TRAINING_FILE + ".zst"):
+        if os.path.exists(path):
+            return [path], None
+    return [], None
+
+
+def iter_lines(paths, dictionary=None):
+    """Yield the JSONL lines of paths in order, decompressing .zst files as a stream.
+
+    Sharded .zst output was compressed with a shared dictionary, which must
+    be given to decompress it.
+    """
+    dict_data = None
+    if any(path.endswith(".zst") for path in paths):
+        try:
+            import zstandard
+        except ImportError:
+            print("Install zstandard to upload .zst files: pip install zstandard")
+            sys.exit(1)
+        if dictionary:
+            with open(dictionary, "rb") as f:
+                dict_data = zstandard.ZstdCompressionDict(f.read())
+
+    for path in paths:
+        with open(path, "rb") as raw:
+            if path.endswith(".zst"):
+                raw = io.BufferedReader(zstandard.ZstdDecompressor(dict_data=dict_data).stream_reader(raw))
+            for line in raw:
+                if line.strip():
+                    yield line
+
+
+def upload_file(client, paths, dictionary=None, mix=None):
+    """Upload JSONL files as one file, in the mix's order if there is one.
+
+    A single plain file without a mix is uploaded as is. Otherwise the files
+    are decompressed as a stream and written once to a temporary file, removed
+    when the upload finishes: Together takes one plain JSONL file, and the SDK
+    only uploads from a path. Laying out a mix holds the lines in memory.
+    """
+    if len(paths) == 1 and not paths[0].endswith(".zst") and mix is None:
+        return client.files.upload(file=paths[0], purpose="fine-tune")
+
+    lines = iter_lines(paths, dictionary)
+    if mix is not None:
+        entries = list(lines)
+        lines = entries
+        if len(entries) == mix["entries"]:
+            lines = (entries[i] for i in mix["order"])
+        else:
+            print(f"Ignoring {MIX_FILE}: made for {mix['entries']} entries, the data has {len(entries)}")
+
+    fd, tmp = tempfile.mkstemp(suffix=".jsonl")
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            dst.writelines(lines)
+        return client.files.upload(file=tmp, purpose="fine-tune")
+    finally:
+        os.remove(tmp)
+
+
 def cmd_upload():
     """Upload training data to Together AI."""
     client = Together()
 
-    print(f"Uploading {TRAINING_FILE} ...")
-    response = client.files.upload(file=TRAINING_FILE, purpose="fine-tune")
+    paths, dictionary = training_files()
+    if not paths:
+        print(f"No training data: neither {MANIFEST_FILE} nor {TRAINING_FILE}[.zst] exists.")
+        print("Run python3 convert_training_data.py first.")
+        sys.exit(1)
+    mix = load_mix()
+    print(f"Uploading {paths[0]}" + (f" (+{len(paths) - 1} more shards)" if len(paths) > 1 else "") + " ...")
+    if mix is not None:
+        print(f"  in {MIX_FILE} order: {len(mix['order']):,} samples of {mix['entries']:,} entries, "
+              f"~{mix['tokens']:,} tokens per epoch")
+    response = upload_file(client, paths, dictionary, mix)
     file_id = response.id
 
     state = load_state()
@@ -13,17 +13,31 @@ Requirements:
 Usage:
   python3 train_unsloth.py
 
+Reads training_data.jsonl, training_data.jsonl.zst, or the ChatML shards
+listed in manifest.json (see convert_training_data.py --zstd/--shard-size).
+Compressed files are decompressed as a stream, never to disk. If
+pretokenized/ (convert_training_data.py --pretokenize) was built with the same
+tokenizer, it is memory-mapped and used instead, skipping templating and
+tokenization. Either way, entries are trained on in the order and number
+given by mix.json (convert_training_data.py --mix-weights/--token-budget).
+
 Output:
   ./gerbil-lora-output/   — LoRA adapter weights
   Then run: python3 merge_and_export.py
 """
 
+import hashlib
+import io
+import json
 import os
 
 # ── Config ──────────────────────────────────────────────────────────
 MODEL_NAME = "unsloth/Qwen2.5-Coder-7B-Instruct-bnb-4bit"
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "gerbil-lora-output")
 TRAINING_FILE = os.path.join(os.path.dirname(__file__), "training_data.jsonl")
+ZSTD_DICT_FILE = os.path.join(os.path.dirname(__file__), "training_data.zdict")  # only for zstd shards
+PRETOKENIZED_DIR = os.path.join(os.path.dirname(__file__), "pretokenized")
+MIX_FILE = os.path.join(os.path.dirname(__file__), "mix.json")
 MAX_SEQ_LENGTH = 4096
 EPOCHS = 3
 BATCH_SIZE = 2
@@ -33,11 +47,189 @@ LORA_R = 16
 LORA_ALPHA = 32
 
 
+def training_files() -> list[str]:
+    """Find the ChatML data: the single file, its .zst, or the manifest's shards."""
+    for path in (TRAINING_FILE, TRAINING_FILE + ".zst"):
+        if os.path.exists(path):
+            return [path]
+    data_dir = os.path.dirname(TRAINING_FILE)
+    manifest_path = os.path.join(data_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            shards = json.load(f)["formats"]["chatml"]["shards"]
+        return [os.path.join(data_dir, shard["file"]) for shard in shards]
+    return [TRAINING_FILE]
+
+
+def iter_records(paths: list[str], stamp=None):
+    """Yield JSONL records, decompressing .zst files as a stream.
+
+    `stamp` is unused; it changes the datasets cache key when the files change.
+    """
+    import zstandard
+
+    dict_data = None
+    if os.path.exists(ZSTD_DICT_FILE):
+        with open(ZSTD_DICT_FILE, "rb") as f:
+            dict_data = zstandard.ZstdCompressionDict(f.read())
+
+    for path in paths:
+        with open(path, "rb") as raw:
+            if path.endswith(".zst"):
+                raw = zstandard.ZstdDecompressor(dict_data=dict_data).stream_reader(raw)
+            for line in io.TextIOWrapper(raw, encoding="utf-8"):
+                if line.strip():
+                    yield json.loads(line)
+
+
+def load_mix_order(entries: int):
+    """Entry indices in training order from mix.json, if it was made for this data."""
+    if not os.path.exists(MIX_FILE):
+        return None
+    with open(MIX_FILE) as f:
+        mix = json.load(f)
+    if mix["entries"] != entries:
+        print(f"Ignoring {MIX_FILE}: made for {mix['entries']} entries, the data has {entries}")
+        return None
+    print(f"Using {MIX_FILE}: {len(mix['order'])} samples, ~{mix['tokens']:,} tokens per epoch")
+    return mix["order"]
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Same hash as convert_training_data.tokenizer_fingerprint."""
+    h = hashlib.sha256()
+    h.update(json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False).encode())
+    h.update(b"\0" + str(tokenizer.chat_template or "").encode())
+    return h.hexdigest()
+
+
+class PackedDataset:
+    """Pre-tokenized entries packed greedily into MAX_SEQ_LENGTH sequences.
+
+    Reads slices of the memory-mapped arrays; nothing is loaded up front.
+    Prompt tokens get label -100 so only the assistant reply is trained on.
+    `order` lists the entries to pack, repeats allowed (default: each once).
+    """
+
+    def __init__(self, tokens, offsets, mask, max_len: int, order=None):
+        import numpy as np
+
+        self.np = np
+        self.tokens, self.offsets, self.mask = tokens, offsets, mask
+        self.max_len = max_len
+        self.packs = []
+        lengths = np.minimum(np.diff(offsets), max_len).tolist()
+        current, size = [], 0
+        for i in range(len(lengths)) if order is None else order:
+            n = lengths[i]
+            if current and size + n > max_len:
+                self.packs.append(current)
+                current, size = [], 0
+            current.append(i)
+            size += n
+        if current:
+            self.packs.append(current)
+
+    def __len__(self):
+        return len(self.packs)
+
+    def __getitem__(self, i):
+        np = self.np
+        input_ids, labels = [], []
+        for j in self.packs[i]:
+            start = int(self.offsets[j])
+            end = min(int(self.offsets[j + 1]), start + self.max_len)
+            ids = self.tokens[start:end].astype(np.int64)
+            input_ids.append(ids)
+            labels.append(np.where(self.mask[start:end] == 1, ids, -100))
+        return {"input_ids": np.concatenate(input_ids), "labels": np.concatenate(labels)}
+
+
+def load_pretokenized(tokenizer):
+    """Memory-map the pre-tokenized corpus, if it was built for this tokenizer."""
+    meta_path = os.path.join(PRETOKENIZED_DIR, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta["fingerprint"] != tokenizer_fingerprint(tokenizer):
+        print(f"Ignoring {PRETOKENIZED_DIR}/: built for tokenizer {meta['tokenizer']}, not {MODEL_NAME}")
+        return None
+
+    import numpy as np
+
+    order = "<" if meta["byteorder"] == "little" else ">"
+    files = {name: os.path.join(PRETOKENIZED_DIR, fname) for name, fname in meta["files"].items()}
+    tokens = np.memmap(files["tokens"], dtype=f"{order}u4", mode="r")
+    offsets = np.memmap(files["offsets"], dtype=f"{order}i8", mode="r")
+    mask = np.memmap(files["mask"], dtype=np.uint8, mode="r")
+    return PackedDataset(tokens, offsets, mask, MAX_SEQ_LENGTH, load_mix_order(len(offsets) - 1))
+
+
+def pad_collator(pad_token_id: int):
+    """Pad a batch of packed sequences to its longest member."""
+    import torch
+
+    def collate(batch):
+        width = max(len(item["input_ids"]) for item in batch)
+        input_ids = torch.full((len(batch), width), pad_token_id, dtype=torch.long)
+        labels = torch.full((len(batch), width), -100, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+        for row, item in enumerate(batch):
+            n = len(item["input_ids"])
+            input_ids[row, :n] = torch.from_numpy(item["input_ids"])
+            labels[row, :n] = torch.from_numpy(item["labels"])
+            attention_mask[row, :n] = 1
+        return {"input_ids": input_ids, "labels": labels, "attention_mask": attention_mask}
+
+    return collate
+
+
+def sft_trainer(model, tokenizer, training_args):
+    """Load the JSONL data, apply the chat template and hand it to SFTTrainer."""
+    from trl import SFTTrainer
+    from datasets import Dataset, load_dataset
+
+    # ── Load and format training data ───────────────────────────────
+    files = training_files()
+    print(f"Loading {files[0]}" + (f" (+{len(files) - 1} more shards)" if len(files) > 1 else "") + " ...")
+    if any(path.endswith(".zst") for path in files):
+        stamp = [(path, os.path.getmtime(path), os.path.getsize(path)) for path in files]
+        dataset = Dataset.from_generator(iter_records, gen_kwargs={"paths": files, "stamp": stamp})
+    else:
+        dataset = load_dataset("json", data_files=files, split="train")
+    print(f"Loaded {len(dataset)} examples")
+    order = load_mix_order(len(dataset))
+    if order is not None:
+        dataset = dataset.select(order)  # an index mapping; rows aren't copied
+
+    def format_chatml(example):
+        """Apply the model's chat template to our conversations."""
+        messages = example["conversations"]
+        text = tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=False
+        )
+        return {"text": text}
+
+    dataset = dataset.map(format_chatml, num_proc=2)
+
+    # ── Configure trainer ───────────────────────────────────────────
+    print("Starting training ...")
+    return SFTTrainer(
+        model=model,
+        tokenizer=tokenizer,
+        train_dataset=dataset,
+        dataset_text_field="text",
+        max_seq_length=MAX_SEQ_LENGTH,
+        dataset_num_proc=2,
+        packing=True,  # pack short examples together for efficiency
+        args=training_args,
+    )
+
+
 def main():
     from unsloth import FastLanguageModel
-    from trl import SFTTrainer
-    from transformers import TrainingArguments
-    from datasets import load_dataset
+    from transformers import Trainer, TrainingArguments
 
     # ── Load model in 4-bit ─────────────────────────────────────────
     print(f"Loading {MODEL_NAME} ...")
@@ -69,47 +261,35 @@ def main():
     total = sum(p.numel() for p in model.parameters())
     print(f"Trainable: {trainable:,} / {total:,} ({100*trainable/total:.2f}%)")
 
-    # ── Load and format training data ───────────────────────────────
-    print(f"Loading {TRAINING_FILE} ...")
-    dataset = load_dataset("json", data_files=TRAINING_FILE, split="train")
-    print(f"Loaded {len(dataset)} examples")
+    training_args = TrainingArguments(
+        output_dir=OUTPUT_DIR,
+        per_device_train_batch_size=BATCH_SIZE,
+        gradient_accumulation_steps=GRADIENT_ACCUMULATION,
+        warmup_steps=10,
+        num_train_epochs=EPOCHS,
+        learning_rate=LEARNING_RATE,
+        fp16=True,
+        logging_steps=10,
+        optim="adamw_8bit",
+        save_strategy="epoch",
+        save_total_limit=2,
+        seed=42,
+        report_to="none",
+    )
 
-    def format_chatml(example):
-        """Apply the model's chat template to our conversations."""
-        messages = example["conversations"]
-        text = tokenizer.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=False
+    # ── Pre-tokenized corpus, if the converter built one for this tokenizer ──
+    packed = load_pretokenized(tokenizer)
+    if packed is not None:
+        print(f"Using pre-tokenized corpus in {PRETOKENIZED_DIR}/ ({len(packed)} packed sequences)")
+        print("Starting training ...")
+        trainer = Trainer(
+            model=model,
+            args=training_args,
+            train_dataset=packed,
+            data_collator=pad_collator(tokenizer.pad_token_id),
         )
-        return {"text": text}
-
-    dataset = dataset.map(format_chatml, num_proc=2)
-
-    # ── Configure trainer ───────────────────────────────────────────
-    print("Starting training ...")
-    trainer = SFTTrainer(
-        model=model,
-        tokenizer=tokenizer,
-        train_dataset=dataset,
-        dataset_text_field="text",
-        max_seq_length=MAX_SEQ_LENGTH,
-        dataset_num_proc=2,
-        packing=True,  # pack short examples together for efficiency
-        args=TrainingArguments(
-            output_dir=OUTPUT_DIR,
-            per_device_train_batch_size=BATCH_SIZE,
-            gradient_accumulation_steps=GRADIENT_ACCUMULATION,
-            warmup_steps=10,
-            num_train_epochs=EPOCHS,
-            learning_rate=LEARNING_RATE,
-            fp16=True,
-            logging_steps=10,
-            optim="adamw_8bit",
-            save_strategy="epoch",
-            save_total_limit=2,
-            seed=42,
-            report_to="none",
-        ),
-    )
+    else:
+        trainer = sft_trainer(model, tokenizer, training_args)
 
     # ── Train ───────────────────────────────────────────────────────
     stats = trainer.train()
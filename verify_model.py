@@ -13,14 +13,35 @@ Usage:
 
   # Test against OpenRouter
   python3 verify_model.py --base-url https://openrouter.ai/api/v1 --model your-model --api-key $OPENROUTER_API_KEY
+
+Test cases run concurrently (--concurrency, default 8) over one pooled
+keep-alive connection; results are still printed in order.
+
+  # Keep answers on disk; rerunning after editing must_contain/must_not_contain costs no inference
+  python3 verify_model.py --base-url http://localhost:11434/v1 --model gerbil-qwen --cache
+
+  # Run a JSONL suite instead of the built-in cases, with per-tag results
+  python3 verify_model.py --base-url http://localhost:11434/v1 --model gerbil-qwen --suite regression.jsonl
+
+  # 5 samples per prompt (one n=5 request where supported): pass@1, pass@5, term hit rates
+  python3 verify_model.py --base-url http://localhost:8000/v1 --model gerbil-qwen --samples 5
+
+  # Measure streaming latency instead: TTFT, inter-token latency, decode tok/s
+  python3 verify_model.py --base-url http://localhost:11434/v1 --model gerbil-qwen --bench -j 1
 """
 
 import argparse
+import asyncio
+import hashlib
 import json
+import os
+import sqlite3
 import sys
+import time
+from collections import Counter
 
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI, BadRequestError
 except ImportError:
     print("Install the OpenAI SDK: pip install openai")
     sys.exit(1)
@@ -37,68 +58,226 @@ TEST_CASES = [
         "prompt": "How do I iterate over a hash table in Gerbil Scheme?",
         "must_contain": ["import", "in-hash", "for"],
         "must_not_contain": ["hash-table-for-each"],
+        "tags": ["iteration", "hash-tables"],
     },
     {
         "prompt": "What's the difference between hash-get and hash-ref in Gerbil?",
         "must_contain": ["hash-get", "hash-ref", "#f"],
         "must_not_contain": [],
+        "tags": ["hash-tables"],
     },
     {
         "prompt": "Show me how to parse JSON in Gerbil Scheme.",
         "must_contain": [":std/text/json", "read-json"],
         "must_not_contain": ["require", "json-parse"],
+        "tags": ["json", "imports"],
     },
     {
         "prompt": "How do I define a custom error class in Gerbil?",
         "must_contain": ["deferror-class", ":std/error"],
         "must_not_contain": ["define-condition-type"],
+        "tags": ["errors"],
     },
     {
         "prompt": "What's wrong with passing u8vector to a (pointer void) FFI parameter in Gerbil?",
         "must_contain": ["scheme-object"],
         "must_not_contain": [],
+        "tags": ["ffi"],
     },
     {
         "prompt": "How do I spawn an actor in Gerbil Scheme?",
         "must_contain": ["spawn"],
         "must_not_contain": ["make-actor", "create-actor"],
+        "tags": ["actors"],
     },
     {
         "prompt": "Show me pattern matching with struct destructuring in Gerbil.",
         "must_contain": ["match", "defstruct"],
         "must_not_contain": [],
+        "tags": ["match", "structs"],
     },
     {
         "prompt": "How do I write unit tests in Gerbil Scheme?",
         "must_contain": [":std/test", "test-suite", "check"],
         "must_not_contain": [],
+        "tags": ["testing"],
     },
     {
         "prompt": "What imports do I need to use channels in Gerbil?",
         "must_contain": [":std/misc/channel"],
         "must_not_contain": [],
+        "tags": ["concurrency", "imports"],
     },
     {
         "prompt": "How do I use the for/collect macro in Gerbil?",
         "must_contain": [":std/iter", "for/collect"],
         "must_not_contain": [],
+        "tags": ["iteration", "macros"],
     },
 ]
 
 
-def run_test(client, model, test_case):
-    """Run a single test and return pass/fail with details."""
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 120.0  # seconds per attempt; a 1024-token answer on a cold endpoint is slow
+DEFAULT_RETRIES = 2      # the SDK retries connection errors, 408/409/429 and 5xx with backoff
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".verify_cache.sqlite")
+CACHE_MAX_MB = 64
+
+
+class ResponseCache:
+    """Answers kept in SQLite, keyed by endpoint, model, messages and sampling parameters.
+
+    With refresh=True cached answers are ignored and overwritten. Once the
+    stored answers exceed max_bytes, the least recently used are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int, refresh: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.hits = self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                        "key TEXT PRIMARY KEY, answer TEXT NOT NULL, size INTEGER NOT NULL, "
+                        "created REAL NOT NULL, used REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+        self.evict()  # in case max_bytes shrank since the last run
+        self.db.commit()
+
+    @staticmethod
+    def key(base_url: str, request: dict) -> str:
+        return hashlib.sha256(json.dumps([base_url.rstrip("/"), request], sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str):
+        row = None if self.refresh else self.db.execute(
+            "SELECT answer FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return row[0]
+
+    def put(self, key: str, answer: str):
+        now = time.time()
+        self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                        (key, answer, len(answer.encode()), now, now))
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        excess = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY used").fetchall():
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            excess -= size
+            if excess <= 0:
+                break
+
+    def close(self):
+        self.db.close()
+
+
+def chat_request(model, prompt):
+    """The chat completion parameters for a prompt; also the cache key."""
+    return {
+        "model": model,
+        "messages": [
             {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": test_case["prompt"]},
+            {"role": "user", "content": prompt},
         ],
-        max_tokens=1024,
-        temperature=0.2,
-    )
+        "max_tokens": 1024,
+        "temperature": 0.2,
+    }
+
+
+async def ask(client, model, prompt, limit, cache=None):
+    """Send one prompt and return the answer text, from the cache if it has it.
 
-    answer = response.choices[0].message.content
+    The request waits for a slot in `limit`, the run's semaphore.
+    """
+    request = chat_request(model, prompt)
+    if cache is not None:
+        key = cache.key(str(client.base_url), request)
+        answer = cache.get(key)
+        if answer is not None:
+            return answer
+    async with limit:
+        response = await client.chat.completions.create(**request)
+    answer = response.choices[0].message.content or ""
+    if cache is not None:
+        cache.put(key, answer)
+    return answer
+
+
+async def ask_samples(client, model, prompt, k, limit, cache, backend):
+    """k answers to one prompt, in one request with n=k where the backend allows.
+
+    Backends that ignore n (Ollama answers with one choice) or reject it get
+    the missing answers from concurrent single requests, each taking its own
+    slot in `limit`; `backend["n"]` remembers which, so later prompts skip
+    the probe. Sample 0 shares its cache entry with a single-answer run.
+    """
+    request = chat_request(model, prompt)
+    answers, keys = [None] * k, None
+    if cache is not None:
+        base_url = str(client.base_url)
+        keys = [cache.key(base_url, request if i == 0 else {**request, "sample": i}) for i in range(k)]
+        answers = [cache.get(key) for key in keys]
+    missing = [i for i, answer in enumerate(answers) if answer is None]
+
+    fresh = []
+    if len(missing) > 1 and backend.get("n", True):
+        try:
+            async with limit:
+                response = await client.chat.completions.create(**request, n=len(missing))
+        except BadRequestError:
+            backend["n"] = False
+        else:
+            fresh = [choice.message.content or "" for choice in response.choices][:len(missing)]
+            backend["n"] = len(fresh) == len(missing)
+    if len(fresh) < len(missing):
+        fresh += await asyncio.gather(*(ask(client, model, prompt, limit) for _ in range(len(missing) - len(fresh))))
+
+    for i, answer in zip(missing, fresh):
+        answers[i] = answer
+        if cache is not None:
+            cache.put(keys[i], answer)
+    return answers
+
+
+# ── Eval suites ─────────────────────────────────────────────────────────
+#
+# A suite is a JSONL file of test cases shaped like TEST_CASES, one per line:
+#   {"prompt": "...", "must_contain": [...], "must_not_contain": [...], "tags": [...]}
+# Only "prompt" is required. Tags group the results; a case can have several.
+
+def load_suite(path):
+    """Read test cases from a JSONL suite. Raises ValueError naming the bad line."""
+    cases = []
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                case = json.loads(line)
+                if not isinstance(case, dict) or not isinstance(case.get("prompt"), str):
+                    raise ValueError('expected an object with a "prompt" string')
+                for field in ("must_contain", "must_not_contain", "tags"):
+                    case.setdefault(field, [])
+                    if not all(isinstance(term, str) and term for term in case[field]):
+                        raise ValueError(f'"{field}" must be a list of non-empty strings')
+            except ValueError as e:
+                raise ValueError(f"{path}:{lineno}: {e}") from None
+            case.setdefault("id", f"{os.path.basename(path)}:{lineno}")
+            cases.append(case)
+    return cases
+
+
+def score(test_case, answer):
+    """Check an answer against a test case. Returns (passed, issues)."""
     answer_lower = answer.lower()
 
     passed = True
@@ -114,7 +293,163 @@ def run_test(client, model, test_case):
             passed = False
             issues.append(f"contains wrong term '{term}'")
 
-    return passed, answer, issues
+    return passed, issues
+
+
+async def run_test(client, model, test_case, limit, cache=None, samples=1, backend=None):
+    """Run a single test. Returns (passing samples, answers, issues, term hits).
+
+    With several samples each issue says in how many it occurred, and term
+    hits counts the samples containing each term.
+    """
+    if samples == 1:
+        answers = [await ask(client, model, test_case["prompt"], limit, cache)]
+    else:
+        answers = await ask_samples(client, model, test_case["prompt"], samples, limit, cache, backend)
+    results = [score(test_case, answer) for answer in answers]
+    passing = sum(ok for ok, _ in results)
+    lowered = [answer.lower() for answer in answers]
+    hits = {term: sum(term.lower() in answer for answer in lowered)
+            for term in test_case["must_contain"] + test_case["must_not_contain"]}
+    if samples == 1:
+        return passing, answers, results[0][1], hits
+    counts = Counter(issue for _, issues in results for issue in issues)
+    return passing, answers, [f"{issue} in {n}/{samples}" for issue, n in counts.items()], hits
+
+
+async def in_order(jobs, concurrency=None):
+    """Run coroutine functions, at most `concurrency` at once; yield their results in order.
+
+    With no concurrency all jobs start at once, for jobs that limit their own
+    requests. A job that raises yields its exception instead.
+    """
+    limit = asyncio.Semaphore(concurrency or max(len(jobs), 1))
+
+    async def run(job):
+        async with limit:
+            return await job()
+
+    tasks = [asyncio.ensure_future(run(job)) for job in jobs]
+    try:
+        for task in tasks:
+            try:
+                yield await task
+            except Exception as e:
+                yield e
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# ── Streaming latency benchmark (--bench) ──────────────────────────────
+
+async def timed_stream(client, model, prompt):
+    """Stream one completion, timing it. All times in seconds from the request.
+
+    `headers` is when the response headers arrived: connection setup (for a
+    new pooled connection), upload and queueing. Token counts come from the
+    server's usage report when it sends one, else one token per content chunk.
+    """
+    start = time.perf_counter()
+    stream = await client.chat.completions.create(**chat_request(model, prompt), stream=True,
+                                                  stream_options={"include_usage": True})
+    headers = time.perf_counter() - start
+    stamps, tokens = [], None
+    async for chunk in stream:
+        if chunk.usage is not None:
+            tokens = chunk.usage.completion_tokens
+        if chunk.choices and chunk.choices[0].delta.content:
+            stamps.append(time.perf_counter() - start)
+    total = time.perf_counter() - start
+    if not stamps:
+        raise RuntimeError("stream ended without any content")
+    tokens = tokens or len(stamps)
+    decode = stamps[-1] - stamps[0]
+    return {
+        "headers": headers,
+        "ttft": stamps[0],
+        "itl": [b - a for a, b in zip(stamps, stamps[1:])],
+        "tokens": tokens,
+        "decode_tps": (tokens - 1) / decode if decode > 0 else None,
+        "total": total,
+    }
+
+
+def percentile(values, p):
+    """Linear-interpolated percentile of a non-empty list."""
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+BENCH_METRICS = [
+    # (label, sample key, scale)
+    ("headers (ms)", "headers", 1000),
+    ("TTFT (ms)", "ttft", 1000),
+    ("inter-token (ms)", "itl", 1000),
+    ("decode (tok/s)", "decode_tps", 1),
+    ("total (s)", "total", 1),
+]
+
+
+def bench_summary(samples, wall):
+    """p50/p95/p99/mean per metric; inter-token gaps are pooled across requests."""
+    summary = {}
+    for _, key, _ in BENCH_METRICS:
+        if key == "itl":
+            values = [gap for sample in samples for gap in sample["itl"]]
+        else:
+            values = [sample[key] for sample in samples if sample[key] is not None]
+        if values:
+            summary[key] = {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+            summary[key]["mean"] = sum(values) / len(values)
+    tokens = sum(sample["tokens"] for sample in samples)
+    summary["throughput_tps"] = tokens / wall if wall > 0 else None
+    return summary
+
+
+async def bench(args, client):
+    prompts = [test["prompt"] for test in args.test_cases] * args.rounds
+    total = len(prompts)
+    jobs = [lambda prompt=prompt: timed_stream(client, args.model, prompt) for prompt in prompts]
+    samples, errors = [], 0
+    start = time.perf_counter()
+
+    results = in_order(jobs, args.concurrency)
+    for i, prompt in enumerate(prompts, 1):
+        result = await results.__anext__()
+        if isinstance(result, Exception):
+            errors += 1
+            print(f"[{i}/{total}] ERROR: {result}  ({prompt[:50]}...)")
+            continue
+        samples.append(result)
+        tps = f"{result['decode_tps']:6.1f} tok/s" if result["decode_tps"] else "     - tok/s"
+        print(f"[{i}/{total}] TTFT {result['ttft'] * 1000:6.0f}ms  {tps}  {result['tokens']:5} tokens  "
+              f"{prompt[:50]}...")
+    wall = time.perf_counter() - start
+
+    if not samples:
+        print("\nNo successful requests to report")
+        sys.exit(1)
+    summary = bench_summary(samples, wall)
+    print(f"\n── Streaming latency: {args.model}, {len(samples)} requests, "
+          f"concurrency {args.concurrency} ──")
+    print(f"  {'':<18}{'p50':>9}{'p95':>9}{'p99':>9}{'mean':>9}")
+    for label, key, scale in BENCH_METRICS:
+        if key in summary:
+            print(f"  {label:<18}" + "".join(f"{summary[key][stat] * scale:>9.1f}"
+                                             for stat in ("p50", "p95", "p99", "mean")))
+    print(f"\nThroughput: {sum(sample['tokens'] for sample in samples):,} tokens in {wall:.1f}s "
+          f"= {summary['throughput_tps']:.1f} tok/s across all requests"
+          + (f"; {errors} requests failed" if errors else ""))
+
+    if args.bench_json:
+        with open(args.bench_json, "w") as f:
+            json.dump({"base_url": args.base_url, "model": args.model, "concurrency": args.concurrency,
+                       "wall_s": wall, "errors": errors, "summary": summary, "samples": samples}, f, indent=2)
+        print(f"Wrote {args.bench_json}")
 
 
 def main():
@@ -123,41 +458,154 @@ def main():
     parser.add_argument("--model", required=True, help="Model name/ID")
     parser.add_argument("--api-key", default="not-needed", help="API key")
     parser.add_argument("--verbose", "-v", action="store_true", help="Show full responses")
+    parser.add_argument("--concurrency", "-j", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Requests in flight at once (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help=f"Seconds to wait for each attempt (default: {DEFAULT_TIMEOUT:g})")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help=f"Retries after a failed or timed-out request (default: {DEFAULT_RETRIES})")
+    parser.add_argument("--bench", action="store_true",
+                        help="Stream the prompts and report latency (TTFT, inter-token, tok/s) instead of "
+                             "scoring answers; use -j 1 for uncontended numbers")
+    parser.add_argument("--rounds", type=int, default=1,
+                        help="With --bench, send the prompt set this many times (default: 1)")
+    parser.add_argument("--bench-json", metavar="PATH",
+                        help="With --bench, also save the summary and per-request samples as JSON")
+    parser.add_argument("--cache", nargs="?", const=CACHE_FILE, metavar="PATH",
+                        help="Reuse answers saved by earlier runs with the same endpoint, model, prompt "
+                             f"and sampling parameters (default file: {os.path.basename(CACHE_FILE)})")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ask the model again and overwrite the cached answers (implies --cache)")
+    parser.add_argument("--cache-size", type=float, default=CACHE_MAX_MB, metavar="MB",
+                        help=f"Evict the least recently used answers beyond this much text (default: {CACHE_MAX_MB})")
+    parser.add_argument("--suite", action="append", metavar="PATH",
+                        help="Run the test cases in this JSONL file instead of the built-in ones; repeatable")
+    parser.add_argument("--report", metavar="PATH",
+                        help="Save per-case and per-tag results as JSON")
+    parser.add_argument("--samples", "-k", type=int, default=1, metavar="K",
+                        help="Sample K answers per prompt (n=K in one request where the backend supports it) "
+                             "and report pass@1 and pass@K (default: 1)")
     args = parser.parse_args()
+    args.test_cases = TEST_CASES
+    if args.suite:
+        try:
+            args.test_cases = [case for path in args.suite for case in load_suite(path)]
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        if not args.test_cases:
+            parser.error("the suite has no test cases")
+    if args.refresh and not args.cache:
+        args.cache = CACHE_FILE
+    if args.bench and args.cache:
+        parser.error("--bench measures live requests; drop --cache/--refresh")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.samples < 1:
+        parser.error("--samples must be at least 1")
+    if args.bench and args.samples > 1:
+        parser.error("--bench streams one answer per prompt; drop --samples")
+    if args.rounds < 1:
+        parser.error("--rounds must be at least 1")
 
-    client = OpenAI(base_url=args.base_url, api_key=args.api_key)
+    asyncio.run(verify(args))
 
-    total = len(TEST_CASES)
-    passed = 0
 
-    for i, test in enumerate(TEST_CASES, 1):
-        print(f"\n[{i}/{total}] {test['prompt'][:70]}...")
+async def verify(args):
+    # One client for the whole run: its connection pool keeps connections alive between requests
+    client = AsyncOpenAI(base_url=args.base_url, api_key=args.api_key,
+                         timeout=args.timeout, max_retries=args.retries)
 
-        try:
-            ok, answer, issues = run_test(client, args.model, test)
-        except Exception as e:
-            print(f"  ERROR: {e}")
-            continue
+    if args.bench:
+        async with client:
+            await bench(args, client)
+        return
 
-        if ok:
-            passed += 1
-            print(f"  PASS")
-        else:
-            print(f"  FAIL: {', '.join(issues)}")
+    test_cases = args.test_cases
+    total = len(test_cases)
+    k = args.samples
+    passed = 0       # cases with at least one passing sample (pass@k)
+    pass_at_1 = 0.0  # sum of per-case passing fractions
+    start = time.perf_counter()
+
+    cache = ResponseCache(args.cache, int(args.cache_size * (1 << 20)), args.refresh) if args.cache else None
+    backend = {}  # what ask_samples learned about n
+    by_tag = {}   # tag → {"passed", "failed", "errors", "pass@1"}
+    outcomes = []
 
-        if args.verbose:
-            print(f"  Response: {answer[:200]}...")
+    async with client:
+        # The limit is per request, not per test: --samples can send several for one test
+        limit = asyncio.Semaphore(args.concurrency)
+        jobs = [lambda test=test: run_test(client, args.model, test, limit, cache, k, backend) for test in test_cases]
+        results = in_order(jobs)
+        for i, test in enumerate(test_cases, 1):
+            result = await results.__anext__()
+            print(f"\n[{i}/{total}] {test['prompt'][:70]}...")
+            outcome = {"id": test.get("id", f"builtin:{i}"), "prompt": test["prompt"], "tags": test.get("tags", [])}
 
+            fraction = 0.0
+            if isinstance(result, Exception):
+                status, issues = "errors", [str(result)]
+                print(f"  ERROR: {result}")
+            else:
+                passing, answers, issues, hits = result
+                fraction = passing / k
+                status = "passed" if passing else "failed"
+                passed += bool(passing)
+                pass_at_1 += fraction
+                verdict = "PASS" if passing else "FAIL"
+                if k > 1:
+                    verdict += f" {passing}/{k} samples"
+                print(f"  {verdict}" + (f": {', '.join(issues)}" if issues and (k > 1 or not passing) else ""))
+                outcome.update(passing_samples=passing, samples=k, term_hits={t: n / k for t, n in hits.items()})
+
+                if args.verbose:
+                    print(f"  Response: {answers[0][:200]}...")
+
+            for tag in test.get("tags") or ["(untagged)"]:
+                counts = by_tag.setdefault(tag, {"passed": 0, "failed": 0, "errors": 0, "pass@1": 0.0})
+                counts[status] += 1
+                counts["pass@1"] += fraction
+            outcome.update(status=status, issues=issues)
+            outcomes.append(outcome)
+
+    if cache is not None:
+        print(f"\nCache: {cache.hits} answers reused, {cache.misses} generated ({cache.path})")
+        cache.close()
+    if k > 1 and backend.get("n") is False:
+        print(f"\nNote: the backend doesn't honour n; samples were sent as separate concurrent requests")
+
+    if len(by_tag) > 1:
+        print(f"\n── Results by tag ──")
+        print(f"  {'tag':<24}{'passed':>8}{'failed':>8}{'errors':>8}{'pass %':>8}"
+              + (f"{'pass@1':>8}" if k > 1 else ""))
+        cases = {tag: counts["passed"] + counts["failed"] + counts["errors"] for tag, counts in by_tag.items()}
+        for tag, counts in sorted(by_tag.items(), key=lambda x: (x[1]["pass@1"] / cases[x[0]], x[0])):
+            n = cases[tag]
+            print(f"  {tag:<24}{counts['passed']:>8}{counts['failed']:>8}{counts['errors']:>8}"
+                  f"{100 * counts['passed'] / n:>7.0f}%" + (f"{100 * counts['pass@1'] / n:>7.0f}%" if k > 1 else ""))
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"base_url": args.base_url, "model": args.model, "samples": k,
+                       "passed": passed, "total": total, "pass@1": pass_at_1 / total, f"pass@{k}": passed / total,
+                       "tags": by_tag, "cases": outcomes}, f, indent=2)
+        print(f"\nWrote {args.report}")
+
+    elapsed = time.perf_counter() - start
     print(f"\n{'='*50}")
-    print(f"Results: {passed}/{total} passed ({100*passed//total}%)")
+    if k == 1:
+        print(f"Results: {passed}/{total} passed ({100*passed//total}%) in {elapsed:.1f}s")
+    else:
+        print(f"Results: pass@1 {100 * pass_at_1 / total:.1f}%, pass@{k} {100 * passed / total:.1f}% "
+              f"({passed}/{total} prompts passed at least once, {k} samples each) in {elapsed:.1f}s")
 
-    if passed >= total * 0.8:
+    # Judged on single-sample accuracy, so the verdict means the same with --samples
+    if pass_at_1 >= total * 0.8:
         print("Model looks good for Gerbil Scheme!")
-    elif passed >= total * 0.5:
+    elif pass_at_1 >= total * 0.5:
         print("Partial success — consider more training epochs or data.")
     else:
         print("Model needs more training. Check data format and hyperparameters.")
 
-
 if __name__ == "__main__":
     main()